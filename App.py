@@ -3,10 +3,19 @@ import os
 from dotenv import load_dotenv
 from langchain_core.messages import HumanMessage, SystemMessage, ToolMessage
 import datetime
-from agent import Agent
-import json
-import re
-import base64
+from agent import Agent, itinerary_text, stream_events
+from trip_context import TripContext
+from instrumentation import collect, stage_summary, start_metrics_server
+from itinerary_cache import get_itinerary_cache, remember_itinerary, reuse_itinerary
+from flex_dates import flexible_search
+from speculative import SPECULATIVE_PREFETCH, SpeculativePrefetcher
+from dataclasses import replace
+from multi_city import parse_stops
+from itinerary_parser import ItineraryParseError, parse_itinerary, validate_itinerary
+from assets import background_css
+from render import STYLES, render_day, render_results, render_tool_preview
+import time
+import uuid
 
 
 # Load environment variables
@@ -16,6 +25,8 @@ st.set_page_config(page_title="Trip Genie", layout="wide")
 
 # Constants
 CURRENT_YEAR = datetime.datetime.now().year
+# Show per-stage timings under the itinerary (also enabled with ?debug=1)
+DEBUG_TIMINGS = os.getenv("DEBUG_TIMINGS") == "1"
 response =""
 
 
@@ -23,19 +34,83 @@ response =""
 if "start_clicked" not in st.session_state:
     st.session_state.start_clicked = False
 
-# Background Image function
-def get_base64_image(path):
-    with open(path, "rb") as img_file:
-        return base64.b64encode(img_file.read()).decode()
+# Resume the last trip of this browser session after a reload or server restart;
+# the conversation itself is read back from the durable checkpointer
+if "thread_id" not in st.session_state and st.query_params.get("trip"):
+    st.session_state.thread_id = st.query_params["trip"]
+    st.session_state.start_clicked = True
+    st.session_state.user_prompt = ""
+    st.session_state.chat_history = []
+
+# Build the agent (LLM client, tools and compiled graph) once per process.
+# Per-session state lives in the graph checkpointer under the session's thread_id.
+@st.cache_resource
+def get_agent():
+    start_metrics_server()
+    return Agent()
+
+
+# Background searches while the form is being filled in, shared by all sessions
+@st.cache_resource
+def get_prefetcher():
+    return SpeculativePrefetcher()
+
+
+def timed_get_agent():
+    start = time.perf_counter()
+    agent = get_agent()
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    if "agent_ready_ms" not in st.session_state:
+        st.session_state.agent_ready_ms = elapsed_ms
+        print(f"⏱️ Agent ready in {elapsed_ms:.1f} ms")
+    return agent
+
+
+def stream_agent(agent, messages, config):
+    """
+    Run the graph in streaming mode. Tool results render as soon as
+    invoke_tools finishes and itinerary days as soon as the LLM has emitted
+    them; the live view is cleared once the final state is available.
+    """
+    start = time.perf_counter()
+    first_content_ms = None
+    live = st.empty()
+    with live.container():
+        st.markdown(STYLES, unsafe_allow_html=True)
+        hotel_area, flight_area = st.columns(2)
+        general_area = st.empty()
+        plan_area = st.container()
+
+    for event in stream_events(agent.graph, messages, config):
+        rendered = False
+        if event[0] == "tools":
+            html = render_tool_preview(event[1], event[2])
+            if html:
+                area = hotel_area if event[1] == "hotels_finder" else flight_area
+                area.markdown(html, unsafe_allow_html=True)
+                rendered = True
+        elif event[0] == "general":
+            general_area.markdown(f"### {event[1]}")
+            rendered = True
+        elif isinstance(event[2], list):
+            plan_area.markdown(render_day(event[1], event[2]), unsafe_allow_html=True)
+            rendered = True
+
+        if rendered and first_content_ms is None:
+            first_content_ms = (time.perf_counter() - start) * 1000
+            print(f"⏱️ First content after {first_content_ms:.0f} ms")
+
+    live.empty()
+    return agent.graph.get_state(config).values
+
 
 # Show background image until user clicks in the start button
 if not st.session_state.start_clicked:
-    background_base64 = get_base64_image("images/Trip_Genie.png")
-
+    # Optimized, content-hashed static files (see assets.py), built once per process
     page_bg = f"""
     <style>
     [data-testid="stApp"] {{
-        background-image: url("data:image/png;base64,{background_base64}");
+        {background_css("landing")}
         background-size: cover;
         background-position: center;
     }}
@@ -64,8 +139,8 @@ if not st.session_state.start_clicked:
     
 else:
 
-    # Instantiate the agent
-    agent = Agent()
+    # Get the shared agent
+    agent = timed_get_agent()
     response = ""
 
     if "show_form" not in st.session_state:
@@ -74,7 +149,7 @@ else:
     page_bg = f"""
     <style>
     [data-testid="stApp"] {{
-        background-image: url("https://images.unsplash.com/photo-1476514525535-07fb3b4ae5f1?w=900&auto=format&fit=crop&q=60&ixlib=rb-4.0.3&ixid=M3wxMjA3fDB8MHxzZWFyY2h8NHx8dHJhdmVsfGVufDB8fDB8fHww");
+        {background_css("planner")}
         background-size: cover;
         background-position: center;
         color : black;
@@ -126,7 +201,7 @@ else:
             end_date = st.date_input("End date 📅", datetime.date.today())
 
         
-        col5, col6, col7 = st.columns(3)
+        col5, col6, col7, col10 = st.columns(4)
 
         with col5:
             adult = st.number_input("Number of adults 🧑 ", min_value=0, value=1)
@@ -137,6 +212,9 @@ else:
         with col7:
             budget = st.selectbox("Budget Level 💰", ["Low", "Medium", "High"])
 
+        with col10:
+            flex_days = st.number_input("Flexible dates ± days 🔀", min_value=0, max_value=3, value=0)
+
         col8, col9 = st.columns(2)
 
         with col8:
@@ -145,29 +223,53 @@ else:
         with col9:
             avoid = st.text_area("Anything to avoid? 🚫")
 
+        # The destination and dates above are the first stay; extra lines make it a multi-city trip
+        more_stops = st.text_area("More cities 🗺️ (optional, one per line: City, YYYY-MM-DD, YYYY-MM-DD)")
+
         st.markdown("</div>", unsafe_allow_html=True)
-    
+
+    form_values = dict(
+        origin=origin, destination=destination, start_date=start_date, end_date=end_date,
+        budget=budget, interests=interests, avoid=avoid, adults=adult, children=children,
+        flex_days=flex_days
+    )
+    try:
+        stops = parse_stops(more_stops)
+        if stops:
+            first_stay = {"destination": destination, "start_date": str(start_date), "end_date": str(end_date)}
+            form_values["legs"] = [first_stay] + stops
+        form_context = TripContext.from_dict(form_values)
+    except ValueError as e:
+        st.error(f"More cities: {e}")
+        form_context = TripContext.from_dict(dict(form_values, legs=()))
+    # Start the hotel/flight searches while the user is still thinking
+    if SPECULATIVE_PREFETCH:
+        if "prefetch_session" not in st.session_state:
+            st.session_state.prefetch_session = uuid.uuid4().hex
+        get_prefetcher().update(st.session_state.prefetch_session, form_context)
 
     if st.button("✈️ Generate Itinerary",use_container_width=True):
-        user_message = f"""
-Create a personalized itinerary.
-origin: {origin}
-Destination: {destination}
-Start Date: {start_date}
-End Date: {end_date}
-Budget: {budget}
-Interests: {interests}
-Avoid: {avoid}
-children: {children}
-adult: {adult}
-"""
+        trip_context = form_context
+        if SPECULATIVE_PREFETCH:
+            get_prefetcher().commit(st.session_state.prefetch_session, trip_context)
+        st.session_state.flex_grid = None
+        if trip_context.flex_days and end_date > start_date and not trip_context.legs:
+            # Search the whole date window up front and plan the cheapest dates
+            with st.spinner("Comparing prices across flexible dates..."):
+                flex = flexible_search(trip_context, trip_context.flex_days)
+            cheapest = flex.cheapest()
+            if cheapest:
+                print(f"📅 Cheapest dates: {cheapest['outbound_date']} → {cheapest['return_date']} ({cheapest['total']:.0f})")
+                trip_context = replace(trip_context, start_date=cheapest["outbound_date"], end_date=cheapest["return_date"])
+                st.session_state.flex_grid = flex.grid()
+        user_message = trip_context.user_message()
         st.session_state.user_prompt = user_message
-        st.session_state.origin = origin
-        st.session_state.destination = destination
-        st.session_state.start_date = start_date
-        st.session_state.end_date = end_date
-        st.session_state.adult = adult
+        st.session_state.trip_context = trip_context
         st.session_state.chat_history = [HumanMessage(content=user_message)]
+        # Each submission gets its own checkpointer thread; the graph runs once for it
+        st.session_state.thread_id = f"travel_agent_session-{uuid.uuid4().hex}"
+        st.query_params["trip"] = st.session_state.thread_id
+        st.session_state.pending_run = True
         st.rerun()
 
         #st.session_state.show_form = False
@@ -176,175 +278,85 @@ adult: {adult}
 
 # Run agent if user_prompt exists
 if "user_prompt" in st.session_state:
-    with st.spinner("Planning your trip..."):
-        valid_messages = [msg for msg in st.session_state.chat_history if getattr(msg, "content", "").strip()]
-        if valid_messages:
-            events = agent.graph.invoke(
-                {"messages": valid_messages},
-                config={"thread_id": "travel_agent_session"}
-            )
-            
-            ai_msg = events['messages'][1]  # AIMessage object
-            content = ai_msg.content        # This is the string that contains the ```json ... ``` block
-
-            # Step 2: Extract JSON from content
-            json_match = re.search(r'```json\n(.*?)\n```', content, re.DOTALL)
-
-
-            if json_match:
-                json_str = json_match.group(1)
-                response = json.loads(json_str)
+    with st.spinner("Planning your trip..."), collect() as spans:
+        agent = timed_get_agent()
+        trip_context = st.session_state.get("trip_context")
+        config = {"configurable": {
+            "thread_id": st.session_state.thread_id,
+            "trip_context": trip_context,
+        }}
+        if st.session_state.get("pending_run") and trip_context:
+            # Near-duplicate trips reuse a cached plan with fresh hotel/flight prices
+            st.session_state.cached_itinerary = reuse_itinerary(trip_context)
+            if st.session_state.cached_itinerary:
+                st.session_state.pending_run = False
+                st.session_state.debug_spans = spans
+                print(f"♻️ Reused cached itinerary (hit rate {get_itinerary_cache().hit_rate():.0%})")
+        cached_itinerary = st.session_state.get("cached_itinerary")
+
+        # Reruns read the finished run back from the checkpointer instead of re-invoking the graph
+        ran_graph = False
+        events = None if cached_itinerary or st.session_state.get("pending_run") else agent.graph.get_state(config).values
+        if not events and not cached_itinerary:
+            valid_messages = [msg for msg in st.session_state.chat_history if getattr(msg, "content", "").strip()]
+            if valid_messages:
+                request_start = time.perf_counter()
+                events = stream_agent(agent, valid_messages, config)
+                ran_graph = True
+                st.session_state.pending_run = False
+                st.session_state.debug_spans = spans
+                request_ms = (time.perf_counter() - request_start) * 1000
+                if "first_request_ms" not in st.session_state:
+                    st.session_state.first_request_ms = request_ms
+                    print(f"⏱️ First request: {request_ms:.0f} ms (agent ready in {st.session_state.agent_ready_ms:.1f} ms)")
+                else:
+                    print(f"⏱️ Request: {request_ms:.0f} ms")
+            else:
+                st.warning("Please enter a valid message before generating the trip plan.")
+
+        if cached_itinerary:
+            response = cached_itinerary
+        elif events:
+            try:
+                response = parse_itinerary(itinerary_text(events['messages']) or "")
+                problems = validate_itinerary(response)
+                if problems:
+                    print("⚠️ Itinerary schema problems:", problems)
+                elif ran_graph:
+                    remember_itinerary(trip_context, response)
                 print("✅ Parsed JSON:")
                 print(response)
-            else:
-                print("❌ JSON block not found in cleaned_str.")
-            
-        else:
-            st.warning("Please enter a valid message before generating the trip plan.")
+            except ItineraryParseError as e:
+                print(f"❌ {e}")
+                st.error("Sorry, we couldn't read the generated itinerary. Please try again.")
 
 if response:
-    st.markdown("###")
-   
-    st.markdown(f"""
-        <div style="
-            background-color: rgba(255, 255, 255, 0.60);
-            padding: 2rem;
-            border-radius: 12px;
-            box-shadow: 0 4px 12px rgba(0, 0, 0, 0.15);
-            text-align: center;
-        ">
-            <h3 style="margin: 0;">{response['general']}</h3>
-        </div>
-    """, unsafe_allow_html=True)
-    
-    st.markdown("###")
-
-    hcol,space, fcol, space2, gcol = st.columns([2,0.1,2,0.1,2])
-    with hcol:
-        hotel = response.get("hotel", {})
-        link = hotel.get("link")
-
-        if not link and hotel.get("name"):
-           link = f"https://www.google.com/search?q={hotel['name'].replace(' ', '+')}+booking"
-
-        st.markdown(f"""
-            <div class='card' style="
-                background-color: rgba(255, 255, 255, 0.80);
-                border-radius: 15px;
-                padding: 1em;
-                text-align: center;
-                min-height: 230px;
-                display: flex;
-                flex-direction: column;
-                justify-content: space-between;
-            ">
-                <div>
-                    <h4>🏨 Hotel </h4>
-                    <p><strong>{response['hotel']['name']}</strong><br>
-                    {response['hotel']['price_per_night']} per night<br>
-                    ⭐ {response['hotel']['rating']}</p>
-                </div>
-                <a href="{response['hotel']['link']}" target="_blank">Hotel Website</a>
-            </div>
-        """, unsafe_allow_html=True)
-
-    with fcol:
-        flight = response.get("flight", {})
-
-        if "outbound" in flight:
-            outbound = flight["outbound"]
-            airline = outbound.get('airline', 'N/A')
-            departure_time = outbound.get('departure_time', 'N/A')
-            arrival_time = outbound.get('arrival_time', 'N/A')
-            departure_airport = outbound.get('departure_airport', 'N/A')
-            arrival_airport = outbound.get('arrival_airport', 'N/A')
-            price = outbound.get('price', 'N/A')
-        
-            st.markdown(f"""
-    <div class='card' style="
-        background-color: rgba(255, 255, 255, 0.85);
-        padding: 1.5rem;
-        border-radius: 12px;
-        min-height: 230px;
-        box-shadow: 0 4px 12px rgba(0,0,0,0.1);
-        margin-bottom: 1.5rem;">
-        <h4>✈️ Outbound Flight</h4>
-        <p>
-            <strong>{airline}</strong><br>
-            {departure_time} → {arrival_time}<br>
-            {departure_airport} → {arrival_airport}<br>
-            💰 {price}<br>
-        </p>
-    </div>
-    """, unsafe_allow_html=True)
-
-    with gcol:
-        flight = response.get("flight", {})
-        
-        if "return" in flight:
-            returning = flight["return"]
-            airline = returning.get('airline', 'N/A')
-            departure_time = returning.get('departure_time', 'N/A')
-            arrival_time = returning.get('arrival_time', 'N/A')
-            departure_airport = returning.get('departure_airport', 'N/A')
-            arrival_airport = returning.get('arrival_airport', 'N/A')
-            price = returning.get('price', 'N/A')
-     
-  
-            st.markdown(f"""
-    <div class='card' style="
-        background-color: rgba(255, 255, 255, 0.85);
-        padding: 1.5rem;
-        min-height: 230px;
-        border-radius: 12px;
-        box-shadow: 0 4px 12px rgba(0,0,0,0.1);">
-        <h4>🔁 Return Flight</h4>
-        <p>
-            <strong>{airline}</strong><br>
-            {departure_time} → {arrival_time}<br>
-            {departure_airport} → {arrival_airport}<br>
-            💰 {price}<br>
-        </p>
-    </div>
-    """, unsafe_allow_html=True)
-        
-
-    st.markdown("###")
-
-    st.markdown("<h3 style='text-align: center;'>🗓️ Itinerary</h3>", unsafe_allow_html=True)
-    day_map = {
-        "visit": "🏛️",
-        "explore": "🧭",
-        "lunch": "🍽️",
-        "dinner": "🍷",
-        "check-in": "🏨",
-        "check-out": "🧳",
-        "arrival": "🛬",
-        "departure": "🛫",
-        "transfer": "🚗",
-        "nightlife": "🍸",
-        "shopping": "🛍️",
-        "breakfast": "🥐"
-    }
-
-    plan_list = response.get("plan", [])
-    if isinstance(plan_list, list):
-        for day_dict in plan_list:
-            for raw_day, activities in day_dict.items():
-                day_label = raw_day.replace("day", "Day ").capitalize()
-                html = f"""
-            <div class='day-bubble' style="
-                background-color: rgba(255, 255, 255, 0.80);
-                font-weight: bold;
-                text-align: center;
-                border-radius: 8px;
-                padding: 1em;
-                margin-bottom: 1.5em;
-            ">
-                <div class='day-header'>📅 {day_label}</div>
-            """
-                for item in activities:
-                    icon = day_map.get(item['type'].lower(), "📍")
-                    html += f"<p class='activity'><strong>{item['time']}</strong> — {icon} <strong>{item['type']}</strong>: {item['description']}</p>"
-                html += "</div>"
-                st.markdown(html, unsafe_allow_html=True)
+    # The whole results view in one pass (memoized per itinerary)
+    st.markdown(render_results(response), unsafe_allow_html=True)
+
+    flex_grid = st.session_state.get("flex_grid")
+    if flex_grid:
+        st.markdown("<h3 style='text-align: center;'>📊 Total price by dates</h3>", unsafe_allow_html=True)
+        st.dataframe(
+            [{"Outbound ↓ / Return →": out, **dict(zip(flex_grid["return_dates"], row))}
+             for out, row in zip(flex_grid["outbound_dates"], flex_grid["total"])],
+            hide_index=True, use_container_width=True,
+        )
+
+if (DEBUG_TIMINGS or st.query_params.get("debug") == "1") and st.session_state.get("debug_spans"):
+    spans = st.session_state.debug_spans
+    with st.expander("🛠️ Debug timings"):
+        summary = sorted(stage_summary(spans).items(), key=lambda item: -item[1][1])
+        st.dataframe(
+            [{"stage": stage, "calls": calls, "total ms": round(total, 1), "max ms": round(longest, 1)}
+             for stage, (calls, total, longest) in summary],
+            hide_index=True, use_container_width=True,
+        )
+        prompt_tokens = sum(s.get("prompt_tokens") or 0 for s in spans)
+        completion_tokens = sum(s.get("completion_tokens") or 0 for s in spans)
+        errors = [s for s in spans if s.get("error")]
+        st.caption(f"Tokens: {prompt_tokens} prompt / {completion_tokens} completion · {len(errors)} errors")
+        st.dataframe(
+            [{"stage": s["stage"], "ms": s["duration_ms"], "thread": s["thread"], "error": s["error"]} for s in spans],
+            hide_index=True, use_container_width=True,
+        )
@@ -1,170 +1,158 @@
 import datetime
-from hotel_tool import hotels_finder, HotelsInput
-from flight_tool import flights_finder, FlightsInput
+from hotel_tool import hotels_finder, HotelsInput, HotelResult
+from flight_tool import flights_finder, FlightsInput, FlightResult
+from package_optimizer import winners
+from checkpointer import get_checkpointer
+from context_budget import MAX_PROMPT_TOKENS, MAX_TOOL_ROUNDS, fit_messages, tool_rounds
+from token_count import estimate_tokens, message_tokens
+from prompts import ITINERARY_PHASE, MULTI_CITY_PHASE, TOOLS_PHASE, prompt_version, system_prompt
+from multi_city import check_legs, leg_context, leg_tool_calls
+from instrumentation import METRICS, count_tokens, span, submit_with_context
+from trip_context import fill_tool_args, get_trip_context
+from itinerary_parser import ItineraryStreamParser
 from typing import Annotated, TypedDict
 import operator
 from langgraph.graph import END, StateGraph
+from langgraph.types import Send
 from langchain_google_genai import ChatGoogleGenerativeAI
-from langgraph.checkpoint.memory import MemorySaver
-from langchain_core.messages import HumanMessage, SystemMessage, ToolMessage
-import streamlit as st
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage
+from langchain_core.runnables import RunnableConfig
 import json
 import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
 
 # Constants
 CURRENT_YEAR = datetime.datetime.now().year
+TOOL_MAX_CONCURRENCY = int(os.getenv("TOOL_MAX_CONCURRENCY", "4"))
+# Keep above SERPAPI_RETRY_BUDGET so a search's own retries finish first
+TOOL_TIMEOUT = float(os.getenv("TOOL_TIMEOUT", "30"))
+# Search hotels/flights straight from the form before the first LLM call
+PREFETCH_TOOLS = os.getenv("PREFETCH_TOOLS", "1") == "1"
+# Graph nodes whose updates carry ToolMessages with search results
+TOOL_RESULT_NODES = ("prefetch", "merge_legs", "invoke_tools")
 
 # Define agent state
 class AgentState(TypedDict):
     messages: Annotated[list, operator.add]
+    # Per-leg search results of multi-city trips, merged by merge_legs
+    legs: Annotated[list, operator.add]
 
-# System prompt with DETAILED example tool call
-TOOLS_SYSTEM_PROMPT = f"""You are a smart travel agency. Use the tools to look up information.
-You are allowed to make multiple calls (either together or in sequence).
-Only look up information when you are sure of what you want.
-The current year is {CURRENT_YEAR}.
-
-In your json output always include:
-- name and rating of the hotel
-- price per night and total cost (with currency symbol, e.g., €84 per night, €337 total)
-- and a link if possible
-- for flights: airline name, price, departure and arrival airports, departure and arrival times, and a booking link
-
-Use 24-hour format (e.g., 14:00) for all times.
-
-Adjust the travel itinerary to start only after the flight's landing time, and begin near the arrival airport.
-
-Always plan to arrive at the airport **at least 3 hours before any international flight departure**. Adjust the itinerary accordingly to allow for enough travel and check-in time.
-
-Always generate a rich, full itinerary that includes specific recommended places to visit, eat and enjoy.
-Use famous, popular, or hidden gem recommendations in the area of the hotel or arrival airport.
-
-Do not be vague. For example, instead of:
-"Visit a Parisian landmark" → say "Visit the Eiffel Tower"
-"Explore nightlife" → say "Have a drink at Little Red Door, one of Paris’ top speakeasies"
-
-Your output must feel like a personal guide built by a local expert, not a generic outline.
-If you need to look up some information before asking a follow up question, you are allowed to do that!
-I want to have in your output links to hotels or flights websites (if possible).
-
-Use the following logic for hotel_class selection based on budget:
-- Low budget: hotel_class = "1,2"
-- Medium budget: hotel_class = "3,4"
-- High budget: hotel_class = "5"
-
-Example Tool Calls:
-
-hotels_finder({{
-    "q": "Paris",
-    "check_in_date": "2024-07-01",
-    "check_out_date": "2024-07-05",
-    "adults": 2,
-    "children": 1,
-    "rooms": 1,
-    "hotel_class": "3,4",
-    "sort_by": 8
-}})
-
-flights_finder({{
-    "departure_airport": "JFK",
-    "arrival_airport": "CDG",
-    "outbound_date": "2024-07-01",
-    "return_date": "2024-07-05",
-    "adults": 2,
-    "children": 0
-}})
-
-When booking flights, automatically determine the closest major airport to a given city using a predefined mapping (e.g., Paris → CDG, Madrid → MAD). Do not ask the user for airport codes. If the city is not in the mapping, make a reasonable assumption based on well-known airport locations.
-
-Please include complete flight information — both outbound (origin to destination) and return (destination to origin) segments.
-IMPORTANT: You must return **only valid JSON** in your response. Do not include any text, titles, explanations, or markdown. The entire response must be a single JSON object exactly in the format shown above. If a value is missing, use null or an empty string, but keep the JSON structure intact.
-{{
-  "general": "general information about the vacation",
-  "hotel": {{
-    "name": "Tokyo Stay",
-    "price_per_night": "$150",
-    "rating": 4.5
-  }},
-  "flight": {{
-  "outbound": {{
-    "airline": "Air France",
-    "departure_time": "10:15",
-    "arrival_time": "14:30",
-    "departure_airport": "JFK",
-    "arrival_airport": "CDG",
-    "price": "$600",
-    "link": "https://booking.airfrance.com"
-  }},
-  "return": {{
-    "airline": "Air France",
-    "departure_time": "12:00",
-    "arrival_time": "15:45",
-    "departure_airport": "CDG",
-    "arrival_airport": "JFK",
-    "price": "$580",
-    "link": "https://booking.airfrance.com"
-  }}
-  }},
-  "plan": [
-    {{
-      "day1": [
-        {{
-          "time": "10:00",
-          "type": "Visit",
-          "description": "Tokyo National Museum"
-        }},
-        {{
-          "time": "13:00",
-          "type": "Lunch",
-          "description": "Sushi Dai"
-        }},
-        {{
-          "time": "15:00",
-          "type": "Explore",
-          "description": "Akihabara"
-        }}
-      ],
-      "day2": [
-        {{
-          "time": "10:00",
-          "type": "Visit",
-          "description": "Tokyo National Museum"
-        }},
-        {{
-          "time": "13:00",
-          "type": "Lunch",
-          "description": "Sushi Dai"
-        }},
-        {{
-          "time": "15:00",
-          "type": "Explore",
-          "description": "Akihabara"
-        }}
-      ]
-    }}
-  ]
-}}
-
-"""
+# The itinerary-phase prompt, for callers that want the full output instructions
+TOOLS_SYSTEM_PROMPT = system_prompt(ITINERARY_PHASE, CURRENT_YEAR)
 
 
 # Define agent tools
 TOOLS = [hotels_finder,flights_finder]
 
+
+def tool_content(result):
+    """Serialize a tool result as compact JSON (result models expose to_dict)."""
+    if isinstance(result, str):
+        return result
+    if isinstance(result, list):
+        result = [r.to_dict() if hasattr(r, "to_dict") else r for r in result]
+    return json.dumps(result, ensure_ascii=False, separators=(",", ":"), default=str)
+
+def _first_result(message):
+    """The best-ranked option of a ToolMessage holding a JSON result list, else None."""
+    try:
+        results = json.loads(message.content)
+    except (TypeError, ValueError):
+        return None
+    return results[0] if isinstance(results, list) and results and isinstance(results[0], dict) else None
+
+def _json_or_text(content):
+    try:
+        return json.loads(content)
+    except (TypeError, ValueError):
+        return content
+
+
+def stream_events(graph, messages, config):
+    """
+    Run the graph in streaming mode and yield progress as it happens:
+    ("tools", tool name, decoded results), ("general", text) and
+    ("day", day key, activities) from the itinerary being written.
+    """
+    parser, message_id = ItineraryStreamParser(), None
+    for mode, chunk in graph.stream({"messages": messages}, config=config, stream_mode=["updates", "messages"]):
+        if mode == "updates":
+            for node in TOOL_RESULT_NODES:
+                for m in (chunk.get(node) or {}).get("messages", []):
+                    if m.type == "tool":
+                        yield "tools", m.name, _json_or_text(m.content)
+            continue
+
+        message_chunk, metadata = chunk
+        if metadata.get("langgraph_node") != "call_tools_llm" or not isinstance(message_chunk.content, str):
+            continue
+        if message_chunk.id != message_id:
+            parser, message_id = ItineraryStreamParser(), message_chunk.id
+        for event in parser.feed(message_chunk.content):
+            if event[0] == "general":
+                yield "general", event[1]
+            elif event[0] == "plan":
+                yield "day", event[1], event[2]
+
+
+def itinerary_text(messages):
+    """The itinerary reply: the last AI message with text and no tool calls, or None."""
+    for m in reversed(messages):
+        if m.type == "ai" and not m.tool_calls and isinstance(m.content, str) and m.content.strip():
+            return m.content
+    return None
+
+
+class _CallClock:
+    """When a queued tool call started running; its timeout counts from there."""
+
+    def __init__(self):
+        self._started = threading.Event()
+        self._at = None
+
+    def start(self):
+        self._at = time.monotonic()
+        self._started.set()
+
+    def remaining(self, timeout, future):
+        # Time spent waiting for a free worker does not count against the timeout
+        while not self._started.wait(0.05):
+            if future.done():
+                return 0.0
+        return max(0.0, self._at + timeout - time.monotonic())
+
 # Build the agent class
 class Agent:
-    def __init__(self):
+    def __init__(self, max_concurrency=None, tool_timeout=None, checkpointer=None, prefetch=PREFETCH_TOOLS):
         self._tools = {t.name: t for t in TOOLS}
-        self._tools_llm = ChatGoogleGenerativeAI(
+        self._prefetch = prefetch
+        # Tool calls from one LLM turn run in parallel on a bounded pool
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_concurrency or TOOL_MAX_CONCURRENCY,
+            thread_name_prefix="tool"
+        )
+        self._tool_timeout = tool_timeout or TOOL_TIMEOUT
+        self._llm = ChatGoogleGenerativeAI(
             model="gemini-1.5-flash",
             temperature=0.7,
             google_api_key=os.getenv("GOOGLE_API_KEY")
-        ).bind_tools(TOOLS)
+        )
+        self._tools_llm = self._llm.bind_tools(TOOLS)
 
         builder = StateGraph(AgentState)
+        builder.add_node("prefetch", self.prefetch)
         builder.add_node("call_tools_llm", self.call_tools_llm)
         builder.add_node("invoke_tools", self.invoke_tools)
-        builder.set_entry_point("call_tools_llm")
+        builder.add_node("search_leg", self.search_leg)
+        builder.add_node("merge_legs", self.merge_legs)
+        builder.set_entry_point("prefetch")
+        # Multi-city trips search every leg in parallel, then merge in leg order
+        builder.add_conditional_edges("prefetch", self.fan_out_legs, ["search_leg", "call_tools_llm"])
+        builder.add_edge("search_leg", "merge_legs")
+        builder.add_edge("merge_legs", "call_tools_llm")
 
         builder.add_conditional_edges("call_tools_llm", self.exists_action, {
             "more_tools": "invoke_tools",
@@ -172,82 +160,198 @@ class Agent:
         })
         builder.add_edge("invoke_tools", "call_tools_llm")
 
-        memory = MemorySaver()
-        self.graph = builder.compile(checkpointer=memory)
+        # Durable, retention-bounded checkpoints keyed by each session's thread_id
+        self.checkpointer = checkpointer or get_checkpointer()
+        self.graph = builder.compile(checkpointer=self.checkpointer)
 
     def exists_action(self, state: AgentState):
         result = state["messages"][-1]
         if hasattr(result, "tool_calls") and len(result.tool_calls) > 0:
+            # Hard cap on agent loop iterations
+            if tool_rounds(state["messages"]) > MAX_TOOL_ROUNDS:
+                return "end"
             return "more_tools"
         return "end"
 
-    def call_tools_llm(self, state: AgentState):
-        messages = [SystemMessage(content=TOOLS_SYSTEM_PROMPT)] + state["messages"]
-        message = self._tools_llm.invoke(messages)
+    @staticmethod
+    def prompt_phase(messages, ctx):
+        """Tool selection until search results are in (or tool rounds run out), then itinerary writing."""
+        if tool_rounds(messages) == 0 and MAX_TOOL_ROUNDS > 0:
+            return TOOLS_PHASE
+        return MULTI_CITY_PHASE if ctx.legs else ITINERARY_PHASE
+
+    def call_tools_llm(self, state: AgentState, config: RunnableConfig):
+        phase = self.prompt_phase(state["messages"], get_trip_context(config))
+        prompt = system_prompt(phase, datetime.date.today().year)
+        budget = MAX_PROMPT_TOKENS - estimate_tokens(prompt)
+        messages = [SystemMessage(content=prompt)] + fit_messages(state["messages"], budget)
+        # Out of tool rounds: the model has to write the itinerary with what it has
+        llm = self._llm if tool_rounds(state["messages"]) >= MAX_TOOL_ROUNDS else self._tools_llm
+        with span("call_tools_llm", phase=phase, prompt_version=prompt_version(phase)) as attrs:
+            attrs["system_tokens"] = estimate_tokens(prompt)
+            message = llm.invoke(messages)
+            # Gemini reports usage; fall back to the offline estimate
+            usage = getattr(message, "usage_metadata", None) or {}
+            attrs["prompt_tokens"] = usage.get("input_tokens") or message_tokens(messages)
+            attrs["completion_tokens"] = usage.get("output_tokens") or message_tokens([message])
+            attrs["tool_calls"] = len(getattr(message, "tool_calls", None) or [])
+        count_tokens("call_tools_llm", attrs["prompt_tokens"], attrs["completion_tokens"])
+        METRICS.observe("system_prompt_tokens", attrs["system_tokens"], phase=phase)
         return {"messages": [message]}
 
-    def invoke_tools(self, state: AgentState):
+    def prefetch(self, state: AgentState, config: RunnableConfig):
+        """
+        Run the hotel and flight searches the form already determines before
+        the first LLM call, and hand them to the model as a completed tool turn.
+        """
+        ctx = get_trip_context(config)
+        if not self._prefetch or not ctx.destination or ctx.legs or tool_rounds(state["messages"]) > 0:
+            return {"messages": []}
+
+        run_id = uuid.uuid4().hex[:8]
+        tool_calls = [{
+            "name": "hotels_finder",
+            "args": {"params": fill_tool_args("hotels_finder", {}, ctx)},
+            "id": f"prefetch_hotels_{run_id}",
+        }]
+        if ctx.origin:
+            tool_calls.append({
+                "name": "flights_finder",
+                "args": {"params": fill_tool_args("flights_finder", {}, ctx)},
+                "id": f"prefetch_flights_{run_id}",
+            })
+
+        request = AIMessage(content="", tool_calls=tool_calls)
+        with span("prefetch", tools=len(tool_calls)):
+            results = self._run_tool_calls(tool_calls, ctx)
+        return {"messages": [request] + results}
+
+    def fan_out_legs(self, state: AgentState, config: RunnableConfig):
+        ctx = get_trip_context(config)
+        if not ctx.legs or tool_rounds(state["messages"]) > 0:
+            return "call_tools_llm"
+        run_id = uuid.uuid4().hex[:8]
+        return [Send("search_leg", {"index": index, "run_id": run_id}) for index in range(len(ctx.legs))]
+
+    def search_leg(self, task: dict, config: RunnableConfig):
+        """Hotel and flight searches of one leg; the legs of a trip run concurrently."""
+        ctx = get_trip_context(config)
+        tool_calls = leg_tool_calls(ctx, task["index"], task["run_id"])
+        with span("search_leg", leg=task["index"], tools=len(tool_calls)):
+            results = self._run_tool_calls(tool_calls, leg_context(ctx, task["index"]))
+        return {"legs": [dict(task, tool_calls=tool_calls, results=results)]}
+
+    def merge_legs(self, state: AgentState, config: RunnableConfig):
+        """
+        Hand all legs to the model as one completed tool turn, in leg order,
+        with the cross-leg consistency notes as the turn's text.
+        """
+        ctx = get_trip_context(config)
+        run_id = state["legs"][-1]["run_id"]
+        legs = sorted((leg for leg in state["legs"] if leg["run_id"] == run_id), key=lambda leg: leg["index"])
+
+        picks = []
+        for leg in legs:
+            pick = {}
+            for t, message in zip(leg["tool_calls"], leg["results"]):
+                kind = "hotel" if t["name"] == "hotels_finder" else "home" if "_home_" in t["id"] else "flight"
+                pick[kind] = _first_result(message)
+            picks.append(pick)
+        with span("merge_legs", legs=len(legs)) as attrs:
+            notes = check_legs(ctx, picks)
+            attrs["notes"] = len(notes)
+
+        content = "Checks across legs:\n" + "\n".join(f"- {note}" for note in notes) if notes else ""
+        request = AIMessage(content=content, tool_calls=[t for leg in legs for t in leg["tool_calls"]])
+        return {"messages": [request] + [m for leg in legs for m in leg["results"]]}
+
+    def invoke_tools(self, state: AgentState, config: RunnableConfig):
         tool_calls = state["messages"][-1].tool_calls
-        results = []
+        with span("invoke_tools", tools=len(tool_calls)):
+            results = self._run_tool_calls(tool_calls, get_trip_context(config))
+        return {"messages": results}
+
+    def _run_tool_calls(self, tool_calls, ctx):
+        # Fill defaults from the run's trip context, then run the searches concurrently
+        futures = []
         for t in tool_calls:
-            if t["name"] not in self._tools:
-                result = "Invalid tool"
+            try:
+                call = self._prepare_tool_call(t, ctx)
+            except Exception as e:
+                call = f"Tool call failed: {e}"
+            if isinstance(call, str):
+                futures.append(call)
             else:
-                args = t.get("args", {})
+                clock = _CallClock()
+                futures.append((submit_with_context(self._executor, self._timed_tool, t["name"], *call, clock), clock))
 
+        results = []
+        for t, future in zip(tool_calls, futures):
+            if isinstance(future, str):
+                result = future
+            else:
+                future, clock = future
                 try:
-                    if t["name"] == "hotels_finder":
-                        if "q" not in args:
-                            args["q"] = st.session_state.get("destination", "")
-                        if "check_in_date" not in args:
-                            args["check_in_date"] = str(st.session_state.get("start_date", datetime.date.today()))
-                        if "check_out_date" not in args:
-                            args["check_out_date"] = str(st.session_state.get("end_date", datetime.date.today()))
-                        if "adults" not in args:
-                            args["adults"] = 2
-                        if "hotel_class" not in args:
-                            budget = st.session_state.get("budget", "Medium").lower()
-                            if budget == "low":
-                                args["hotel_class"] = "1,2"
-                            elif budget == "medium":
-                                args["hotel_class"] = "3,4"
-                            elif budget == "high":
-                                args["hotel_class"] = "5"
-                        if "sort_by" not in args:
-                            budget = st.session_state.get("budget", "Medium").lower()
-                            args["sort_by"] = "3" if budget == "low" else "8"
-
-                        parsed_args = HotelsInput(**args)
-
-                    elif t["name"] == "flights_finder":
-                        with open("cities_iata.json", "r", encoding="utf-8") as f:
-                            cities_iata = json.load(f)
-                        
-                        if "departure_airport" not in args:
-                            args["departure_airport"] = cities_iata.get(st.session_state.get("origin", "").lower())
-                        if "arrival_airport" not in args:
-                            args["arrival_airport"] = cities_iata.get(st.session_state.get("destination", "").lower())
-                        if "outbound_date" not in args:
-                            args["outbound_date"] = str(st.session_state.get("start_date", datetime.date.today()))
-                        if "return_date" not in args:
-                            args["return_date"] = str(st.session_state.get("end_date", datetime.date.today()))
-                        if "adults" not in args:
-                            args["adults"] = st.session_state.get("adult", 1)
-                        if "children" not in args:
-                            args["children"] = st.session_state.get("children", 0)
-
-
-                        parsed_args = FlightsInput(**args)
-
-                    else:
-                        result = "Unsupported tool"
-                        results.append(ToolMessage(tool_call_id=t["id"], name=t["name"], content=str(result)))
-                        continue
-
-                    result = self._tools[t["name"].strip()].invoke({"params": parsed_args})
-
+                    result = future.result(timeout=clock.remaining(self._tool_timeout, future))
+                except FuturesTimeoutError:
+                    future.cancel()
+                    result = f"Tool call timed out after {self._tool_timeout:.0f}s"
+                    METRICS.inc("errors_total", stage=f"tool.{t['name']}", error="Timeout")
                 except Exception as e:
                     result = f"Tool call failed: {e}"
 
-            results.append(ToolMessage(tool_call_id=t["id"], name=t["name"], content=str(result)))
-        return {"messages": results}
\ No newline at end of file
+            results.append(result)
+
+        with span("rank_packages"):
+            results = self._pick_packages(results, ctx)
+        return [ToolMessage(tool_call_id=t["id"], name=t["name"], content=tool_content(result))
+                for t, result in zip(tool_calls, results)]
+
+    @staticmethod
+    def _timed_tool(name, invoke, payload, clock=None):
+        if clock is not None:
+            clock.start()
+        with span(f"tool.{name}") as attrs:
+            result = invoke(payload)
+            attrs["results"] = len(result) if isinstance(result, list) else None
+        return result
+
+    def _pick_packages(self, results, ctx):
+        # Choose the hotel/flight combination deterministically; the LLM only sees the winners
+        def of_type(cls):
+            return [r for r in results if isinstance(r, list) and r and isinstance(r[0], cls)]
+
+        hotels, flights = of_type(HotelResult), of_type(FlightResult)
+        # Each hotel x flight pairing is ranked once, however many lists it feeds
+        ranked = {}
+
+        def pick(hotel_list, flight_list):
+            key = (id(hotel_list), id(flight_list))
+            if key not in ranked:
+                ranked[key] = winners(hotel_list, flight_list, ctx)
+            return ranked[key]
+
+        picked = []
+        for result in results:
+            if any(result is h for h in hotels):
+                result = pick(result, flights[0] if flights else None)[0]
+            elif any(result is f for f in flights):
+                result = pick(hotels[0] if hotels else None, result)[1]
+            picked.append(result)
+        return picked
+
+    def _prepare_tool_call(self, t, ctx):
+        """Return (tool.invoke, payload) for a tool call, or an error string."""
+        if t["name"] not in self._tools:
+            return "Invalid tool"
+
+        args = fill_tool_args(t["name"], t.get("args", {}), ctx)
+
+        if t["name"] == "hotels_finder":
+            parsed_args = HotelsInput(**args)
+        elif t["name"] == "flights_finder":
+            parsed_args = FlightsInput(**args)
+        else:
+            return "Unsupported tool"
+
+        return self._tools[t["name"].strip()].invoke, {"params": parsed_args}
@@ -0,0 +1,253 @@
+"""
+Offline airport resolver.
+
+The bundled dataset (data/airports.csv) is compiled into a compact binary
+file (data/airports.bin) that is memory-mapped and indexed once at import:
+
+    python airports.py build
+
+Lookups accept IATA codes, city names and aliases, ignore accents and
+punctuation, and fall back to prefix and fuzzy matching.
+"""
+import bisect
+import csv
+import difflib
+import math
+import mmap
+import os
+import re
+import struct
+import sys
+import unicodedata
+from functools import lru_cache
+from typing import NamedTuple, Optional
+
+from instrumentation import span
+
+# Constants
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+CSV_PATH = os.path.join(DATA_DIR, "airports.csv")
+BIN_PATH = os.path.join(DATA_DIR, "airports.bin")
+
+MAGIC = b"TGAP"
+VERSION = 1
+# magic, version, record count
+HEADER = struct.Struct("<4sHI")
+# iata, rank, lat, lon, then string-table offsets of city, country and aliases
+RECORD = struct.Struct("<3sBffIII")
+STRING_LEN = struct.Struct("<H")
+
+MAJOR_RANK = 1
+# One typo in a 7+ letter name; shorter near-misses ("Parma" / "Palma") are usually other cities
+FUZZY_CUTOFF = 0.85
+# Common country names that differ from the dataset's
+COUNTRY_ALIASES = {
+    "usa": "united states", "us": "united states", "united states of america": "united states",
+    "uk": "united kingdom", "england": "united kingdom", "scotland": "united kingdom", "great britain": "united kingdom",
+    "uae": "united arab emirates", "holland": "netherlands", "the netherlands": "netherlands",
+    "korea": "south korea", "czechia": "czech republic", "turkiye": "turkey",
+}
+# "Portland, OR": US state codes name the country too
+US_STATES = frozenset(
+    "al ak az ar ca co ct de dc fl ga hi id il in ia ks ky la me md ma mi mn ms mo mt ne nv nh nj nm ny nc nd "
+    "oh ok or pa ri sc sd tn tx ut vt va wa wv wi wy".split()
+)
+
+
+class Airport(NamedTuple):
+    iata: str
+    city: str
+    country: str
+    lat: float
+    lon: float
+    rank: int
+    aliases: tuple
+
+
+def normalize(text):
+    """Lowercase, strip accents and punctuation: 'Zürich ' -> 'zurich'."""
+    text = unicodedata.normalize("NFKD", str(text))
+    text = "".join(c for c in text if not unicodedata.combining(c)).lower()
+    text = text.replace("'", "").replace("’", "")
+    return " ".join(re.sub(r"[^a-z0-9]+", " ", text).split())
+
+
+def build(csv_path=CSV_PATH, bin_path=BIN_PATH):
+    """Compile the CSV dataset into the binary format read by AirportIndex."""
+    with open(csv_path, newline="", encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+
+    strings = bytearray()
+    offsets = {}
+
+    def intern(value):
+        if value not in offsets:
+            encoded = value.encode("utf-8")
+            offsets[value] = len(strings)
+            strings.extend(STRING_LEN.pack(len(encoded)) + encoded)
+        return offsets[value]
+
+    records = bytearray()
+    for row in rows:
+        records.extend(RECORD.pack(
+            row["iata"].encode("ascii"),
+            int(row["rank"]),
+            float(row["lat"]),
+            float(row["lon"]),
+            intern(row["city"]),
+            intern(row["country"]),
+            intern(row["aliases"]),
+        ))
+
+    with open(bin_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(rows)))
+        f.write(records)
+        f.write(strings)
+    return len(rows)
+
+
+class AirportIndex:
+    def __init__(self, path=BIN_PATH):
+        if not os.path.exists(path):
+            build(bin_path=path)
+        self.airports = self._load(path)
+
+        self._by_iata = {a.iata: a for a in self.airports}
+        self._by_name = {}
+        for airport in self.airports:
+            for name in (airport.city,) + airport.aliases:
+                self._by_name.setdefault(normalize(name), []).append(airport)
+        # Primary (rank 1) airports first for every name
+        for matches in self._by_name.values():
+            matches.sort(key=lambda a: a.rank)
+        self._names = sorted(self._by_name)
+
+        self._major = [a for a in self.airports if a.rank == MAJOR_RANK]
+        self._countries = {normalize(a.country) for a in self.airports} | set(COUNTRY_ALIASES)
+
+    @staticmethod
+    def _load(path):
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            magic, version, count = HEADER.unpack_from(buf, 0)
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"Unsupported airport index file: {path}")
+            strings_start = HEADER.size + count * RECORD.size
+
+            def read_string(offset):
+                start = strings_start + offset
+                (length,) = STRING_LEN.unpack_from(buf, start)
+                start += STRING_LEN.size
+                return buf[start:start + length].decode("utf-8")
+
+            airports = []
+            for iata, rank, lat, lon, city, country, aliases in RECORD.iter_unpack(
+                buf[HEADER.size:strings_start]
+            ):
+                alias_text = read_string(aliases)
+                airports.append(Airport(
+                    iata=iata.decode("ascii"),
+                    city=read_string(city),
+                    country=read_string(country),
+                    lat=round(lat, 4),
+                    lon=round(lon, 4),
+                    rank=rank,
+                    aliases=tuple(a for a in alias_text.split("|") if a),
+                ))
+        return airports
+
+    def get(self, iata):
+        return self._by_iata.get(str(iata).strip().upper())
+
+    def lookup(self, query) -> Optional[Airport]:
+        """Resolve a city, alias or IATA code to its primary airport."""
+        return self._lookup(normalize(query or ""), str(query or "").strip())
+
+    @lru_cache(maxsize=4096)
+    def _lookup(self, key, raw):
+        if not key:
+            return None
+        # "CDG" is a code, but "Goa" is a city even though GOA is Genoa's code
+        is_code = len(raw) == 3 and raw.isalpha() and raw.upper() in self._by_iata
+        if is_code and raw.isupper():
+            return self._by_iata[raw]
+        if key in self._by_name:
+            return self._by_name[key][0]
+
+        # "Rome, Italy" / "Tokyo Japan": look up the city in that country. "Paris, TX"
+        # has no airport here, and CDG would send the flight search to the wrong country.
+        city_raw, country = self._split_country(key, raw)
+        if city_raw:
+            country = "united states" if country in US_STATES else COUNTRY_ALIASES.get(country, country)
+            matches = self._by_name.get(normalize(city_raw)) or [self._lookup(normalize(city_raw), city_raw.strip())]
+            return next((a for a in matches if a is not None and normalize(a.country) == country), None)
+
+        if is_code:
+            return self._by_iata[raw.upper()]
+
+        prefixed = self.search(key, limit=1)
+        if prefixed:
+            return prefixed[0]
+
+        close = difflib.get_close_matches(key, self._names, n=1, cutoff=FUZZY_CUTOFF)
+        if close:
+            return self._by_name[close[0]][0]
+        return None
+
+    def _split_country(self, key, raw):
+        """(city text, normalized country or region) if the query has one after the city, else (None, None)."""
+        if "," in raw:
+            city_raw, region = raw.split(",", 1)
+            if normalize(city_raw):
+                return city_raw, normalize(region)
+        words = key.split()
+        for n in range(min(4, len(words) - 1), 0, -1):
+            if " ".join(words[-n:]) in self._countries:
+                return " ".join(words[:-n]), " ".join(words[-n:])
+        return None, None
+
+    def code(self, query) -> Optional[str]:
+        airport = self.lookup(query)
+        return airport.iata if airport else None
+
+    def search(self, prefix, limit=5):
+        """Airports whose city or alias starts with prefix, major airports first."""
+        key = normalize(prefix)
+        if not key:
+            return []
+        start = bisect.bisect_left(self._names, key)
+        found = {}
+        for name in self._names[start:]:
+            if not name.startswith(key):
+                break
+            for airport in self._by_name[name]:
+                found.setdefault(airport.iata, airport)
+        return sorted(found.values(), key=lambda a: (a.rank, a.city))[:limit]
+
+    def nearest(self, lat, lon, major_only=True):
+        """Closest airport (great-circle distance) to a coordinate."""
+        candidates = self._major if major_only else self.airports
+        return min(candidates, key=lambda a: haversine_km(lat, lon, a.lat, a.lon))
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 6371.0 * 2 * math.asin(math.sqrt(a))
+
+
+# Loaded once per process
+with span("airports.load"):
+    AIRPORTS = AirportIndex()
+
+
+def resolve_airport(query):
+    """IATA code for a city/alias/code, or None if nothing plausible matches."""
+    return AIRPORTS.code(query)
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["build"]:
+        print(f"Wrote {build()} airports to {BIN_PATH}")
+    else:
+        for query in sys.argv[1:]:
+            print(query, "->", AIRPORTS.lookup(query))
@@ -0,0 +1,142 @@
+"""
+Optimized, content-hashed static images.
+
+Source images (bundled files or remote URLs) are resized and recompressed
+once into static/ as WebP and a JPEG fallback, named <name>.<hash>.<ext>.
+Streamlit serves static/ at /app/static/ (enableStaticServing in
+.streamlit/config.toml), so browsers download and cache each file once
+instead of receiving a base64 data URI on every rerun. Because names change with content, the files can be
+cached as immutable.
+
+    python assets.py build
+
+pre-builds everything; otherwise each image is built on first use.
+Results are memoized per process.
+"""
+import base64
+import hashlib
+import io
+import os
+import sys
+import threading
+from functools import lru_cache
+
+import httpx
+
+# Constants
+ROOT = os.path.dirname(os.path.abspath(__file__))
+STATIC_DIR = os.path.join(ROOT, "static")
+STATIC_URL = "app/static"
+DOWNLOAD_DIR = os.path.join(ROOT, ".cache", "assets")
+MAX_WIDTH = int(os.getenv("ASSET_MAX_WIDTH", "1920"))
+# Best first. No AVIF: Streamlit's static handler serves unknown extensions as
+# text/plain with nosniff, so browsers would pick the .avif and reject it
+FORMATS = ("webp", "jpg")
+QUALITY = {"webp": 75, "jpg": 80}
+# Bump to rebuild every asset after changing the pipeline
+PIPELINE_VERSION = "1"
+
+IMAGES = {
+    "landing": os.path.join(ROOT, "images", "Trip_Genie.png"),
+    "planner": "https://images.unsplash.com/photo-1476514525535-07fb3b4ae5f1?w=900&auto=format&fit=crop&q=60&ixlib=rb-4.0.3&ixid=M3wxMjA3fDB8MHxzZWFyY2h8NHx8dHJhdmVsfGVufDB8fDB8fHww",
+}
+
+_build_lock = threading.Lock()
+
+
+def _source_bytes(source):
+    """Bytes of a local image, downloading (once) if it is a URL."""
+    if not source.startswith(("http://", "https://")):
+        with open(source, "rb") as f:
+            return f.read()
+    cached = os.path.join(DOWNLOAD_DIR, hashlib.sha256(source.encode("utf-8")).hexdigest()[:16])
+    if not os.path.exists(cached):
+        response = httpx.get(source, timeout=30, follow_redirects=True)
+        response.raise_for_status()
+        os.makedirs(DOWNLOAD_DIR, exist_ok=True)
+        with open(cached + ".tmp", "wb") as f:
+            f.write(response.content)
+        os.replace(cached + ".tmp", cached)
+    with open(cached, "rb") as f:
+        return f.read()
+
+
+def build_image(name, source, max_width=MAX_WIDTH):
+    """
+    Write the optimized variants of one image and return {format: filename},
+    best format first. Existing files with the same content hash are reused.
+    """
+    from PIL import Image
+
+    data = _source_bytes(source)
+    digest = hashlib.sha256(data + f"{PIPELINE_VERSION}:{max_width}:{QUALITY}".encode()).hexdigest()[:12]
+    with _build_lock:
+        files = {fmt: f"{name}.{digest}.{fmt}" for fmt in FORMATS}
+        if all(os.path.exists(os.path.join(STATIC_DIR, f)) for f in files.values()):
+            return files
+
+        image = Image.open(io.BytesIO(data))
+        image = image.convert("RGB")
+        if image.width > max_width:
+            image = image.resize((max_width, round(image.height * max_width / image.width)), Image.LANCZOS)
+
+        os.makedirs(STATIC_DIR, exist_ok=True)
+        for fmt, filename in files.items():
+            path = os.path.join(STATIC_DIR, filename)
+            options = {"quality": QUALITY[fmt]}
+            if fmt == "jpg":
+                options.update(optimize=True, progressive=True)
+            elif fmt == "webp":
+                options.update(method=6)
+            image.save(path + ".tmp", format="JPEG" if fmt == "jpg" else fmt.upper(), **options)
+            os.replace(path + ".tmp", path)
+        _remove_stale(name, set(files.values()))
+        return files
+
+
+def _remove_stale(name, keep):
+    for filename in os.listdir(STATIC_DIR):
+        if filename.startswith(name + ".") and filename not in keep:
+            os.remove(os.path.join(STATIC_DIR, filename))
+
+
+MIME_TYPES = {"webp": "image/webp", "jpg": "image/jpeg"}
+
+
+@lru_cache(maxsize=None)
+def background_css(name):
+    """
+    CSS background-image declarations for a registered image: an image-set of
+    the optimized variants with the JPEG as fallback for older browsers.
+    Falls back to the original source if the pipeline is unavailable.
+    """
+    source = IMAGES[name]
+    try:
+        files = build_image(name, source)
+    except Exception as e:
+        print(f"⚠️ Could not build asset {name}: {e}")
+        return f'background-image: url("{_fallback_url(source)}");'
+
+    urls = {fmt: f"{STATIC_URL}/{filename}" for fmt, filename in files.items()}
+    image_set = ", ".join(f'url("{url}") type("{MIME_TYPES[fmt]}")' for fmt, url in urls.items())
+    return (
+        f'background-image: url("{urls["jpg"]}");\n'
+        f'        background-image: image-set({image_set});'
+    )
+
+
+def _fallback_url(source):
+    if source.startswith(("http://", "https://")):
+        return source
+    with open(source, "rb") as f:
+        return "data:image/png;base64," + base64.b64encode(f.read()).decode()
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["build"]:
+        for image_name, image_source in IMAGES.items():
+            for fmt, filename in build_image(image_name, image_source).items():
+                size = os.path.getsize(os.path.join(STATIC_DIR, filename))
+                print(f"{image_name:<10} {fmt:<5} {size / 1024:>8.0f} KiB  static/{filename}")
+    else:
+        print("usage: python assets.py build")
@@ -0,0 +1,176 @@
+"""
+Headless batch itinerary generation.
+
+    python batch.py trips.jsonl itineraries.jsonl --concurrency 4
+
+Each input line is a trip request:
+    {"id": "paris-jul", "origin": "New York", "destination": "Paris",
+     "start_date": "2025-07-01", "end_date": "2025-07-05", "budget": "Medium",
+     "interests": "food, museums", "avoid": "", "adults": 2, "children": 0}
+
+A multi-city trip replaces destination and dates with its stays:
+    {"id": "europe", "origin": "New York", "legs": [
+        {"destination": "Paris", "start_date": "2025-07-01", "end_date": "2025-07-04"},
+        {"destination": "Rome", "start_date": "2025-07-04", "end_date": "2025-07-08"}], ...}
+
+Results are appended to the output file as they finish, one JSON line per
+trip. Re-running with the same output file skips trips that already
+succeeded, so an interrupted batch can simply be restarted.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from dotenv import load_dotenv
+from langchain_core.messages import HumanMessage
+
+from agent import Agent, itinerary_text
+from itinerary_cache import get_itinerary_cache, remember_itinerary, reuse_itinerary
+from itinerary_parser import ItineraryParseError, parse_itinerary, validate_itinerary
+from speculative import trip_searches
+from trip_context import TripContext
+
+
+def read_trips(path):
+    with open(path, encoding="utf-8") as f:
+        for n, line in enumerate(f, 1):
+            if line.strip():
+                trip = json.loads(line)
+                trip.setdefault("id", str(n))
+                yield trip
+
+
+def completed_ids(path):
+    if not os.path.exists(path):
+        return set()
+    done = set()
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # partial line from an interrupted run
+            if record.get("status") == "ok":
+                done.add(record["id"])
+    return done
+
+
+def warm_searches(trips, executor, seen):
+    """Start each search of trips that is not in seen, so their agent runs hit the SerpAPI cache."""
+    futures = []
+    for trip in trips:
+        try:
+            searches = trip_searches(TripContext.from_dict(trip))
+        except (ValueError, TypeError, AttributeError):
+            continue  # run_trip reports the invalid row
+        for key, tool, params in searches:
+            if key not in seen:
+                seen.add(key)
+                futures.append(executor.submit(tool.invoke, {"params": params}))
+    return futures
+
+
+def run_trip(agent, trip):
+    start = time.perf_counter()
+    record = {"id": trip["id"]}
+    try:
+        ctx = TripContext.from_dict(trip)
+    except (ValueError, TypeError, AttributeError) as e:
+        record.update(status="error", error=f"Invalid trip request: {e}", elapsed_s=0.0)
+        return record
+    try:
+        cached = reuse_itinerary(ctx)
+        if cached:
+            record.update(status="ok", itinerary=cached, cached=True)
+            record["elapsed_s"] = round(time.perf_counter() - start, 2)
+            return record
+        events = agent.graph.invoke(
+            {"messages": [HumanMessage(content=ctx.user_message())]},
+            # A fresh thread per run: the checkpointer is durable, and ids repeat across batch files and retries
+            config={"configurable": {"thread_id": f"batch-{trip['id']}-{uuid.uuid4().hex}", "trip_context": ctx}}
+        )
+        text = itinerary_text(events["messages"])
+        if text is None:
+            raise ItineraryParseError("the agent did not produce an itinerary")
+        itinerary = parse_itinerary(text)
+        if not validate_itinerary(itinerary):
+            remember_itinerary(ctx, itinerary)
+        record.update(status="ok", itinerary=itinerary)
+    except ItineraryParseError as e:
+        record.update(status="error", error=f"Unparseable itinerary: {e}")
+    except Exception as e:
+        record.update(status="error", error=str(e))
+    record["elapsed_s"] = round(time.perf_counter() - start, 2)
+    return record
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate itineraries for a JSONL file of trip requests.")
+    parser.add_argument("input", help="JSONL trip requests")
+    parser.add_argument("output", help="JSONL results (appended; completed trips are skipped)")
+    parser.add_argument("--concurrency", type=int, default=4, help="Trips planned in parallel")
+    parser.add_argument("--warm-ahead", type=int, default=None,
+                        help="Trips ahead of the running ones whose searches are started early "
+                             "(default: 2 x concurrency, 0 disables)")
+    args = parser.parse_args(argv)
+    # Only a short window is warmed: cached flights expire within the hour, and
+    # searches shared by running trips are already deduplicated by the cache
+    warm_ahead = args.concurrency * 2 if args.warm_ahead is None else args.warm_ahead
+
+    load_dotenv()
+    done = completed_ids(args.output)
+    trips = [t for t in read_trips(args.input) if t["id"] not in done]
+    print(f"{len(trips)} trips to run ({len(done)} already done)", file=sys.stderr)
+    if not trips:
+        return
+
+    agent = Agent(max_concurrency=args.concurrency * 2)
+    start = time.perf_counter()
+    counts = {"ok": 0, "error": 0}
+    warmed, warm_futures = set(), []
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor, \
+            ThreadPoolExecutor(max_workers=args.concurrency, thread_name_prefix="warm") as warmer, \
+            open(args.output, "a", encoding="utf-8") as out:
+        # Keep a bounded number of trips in flight and stream results as they finish
+        pending = set()
+        submitted = 0
+        while True:
+            while submitted < len(trips) and len(pending) < args.concurrency * 2:
+                pending.add(executor.submit(run_trip, agent, trips[submitted]))
+                submitted += 1
+            if warm_ahead:
+                # From the trips queued behind the running ones to warm_ahead trips past the queue
+                window = trips[max(0, submitted - args.concurrency):submitted + warm_ahead]
+                warm_futures += warm_searches(window, warmer, warmed)
+            if not pending:
+                break
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                record = future.result()
+                counts[record["status"]] += 1
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                out.flush()
+            total = counts["ok"] + counts["error"]
+            elapsed = time.perf_counter() - start
+            print(f"[{total}/{len(trips)}] {total / elapsed * 60:.1f} trips/min, "
+                  f"{counts['error']} errors", file=sys.stderr)
+
+    elapsed = time.perf_counter() - start
+    print(f"Done: {counts['ok']} ok, {counts['error']} errors in {elapsed:.1f}s "
+          f"({len(trips) / elapsed * 60:.1f} trips/min)", file=sys.stderr)
+    if warm_futures:
+        failed = sum(1 for f in warm_futures if f.exception() is not None)
+        print(f"Warmed {len(warm_futures)} distinct searches ahead of their trips ({failed} failed)",
+              file=sys.stderr)
+    hit_rate = get_itinerary_cache().hit_rate()
+    if hit_rate is not None:
+        print(f"Itinerary cache hit rate: {hit_rate:.0%}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+"""
+Offline end-to-end benchmark of the agent graph.
+
+SerpAPI and Gemini are replaced by record/replay fakes (benchmarks/fakes.py)
+with injected latency, so results are reproducible and need no API keys.
+
+    python -m benchmarks.agent --runs 20 --serp-latency 1.5 --llm-latency 2
+    python -m benchmarks.agent --save-baseline      # after an intended change
+    python -m benchmarks.agent --check              # fail on regressions
+
+Reports end-to-end p50/p95, time per graph node, prompt tokens, peak
+traced memory and itinerary parsing and rendering time. --record runs against the live
+APIs once and stores the responses as fixtures.
+"""
+import argparse
+import json
+import math
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+import uuid
+
+from langchain_core.messages import HumanMessage
+from langgraph.checkpoint.memory import MemorySaver
+
+import agent as agent_module
+import serp_cache
+import serp_client
+from benchmarks.fakes import DEFAULT_LLM_FIXTURE, Latency, ReplayChatModel, ReplaySerp
+from itinerary_parser import ItineraryStreamParser, parse_itinerary, validate_itinerary
+from render import _render
+from trip_context import TripContext
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+# Allowed growth over the baseline before --check fails
+TOLERANCE = {
+    "e2e_p50_ms": 0.20,
+    "e2e_p95_ms": 0.30,
+    "prompt_tokens": 0.05,
+    "peak_memory_kb": 0.25,
+    "parse_ms": 0.50,
+    "render_ms": 0.50,
+}
+
+TRIP = TripContext(
+    origin="New York", destination="Paris", start_date="2025-07-01", end_date="2025-07-05",
+    budget="Medium", interests="food, museums", avoid="", adults=2, children=0,
+)
+
+
+def percentile(values, pct):
+    # Nearest-rank percentile
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+def build_agent(args):
+    serp = ReplaySerp(
+        latency=Latency(args.serp_latency, args.jitter, seed=1),
+        record=args.record, upstream=serp_client.search,
+    )
+    llm = ReplayChatModel(
+        fixture=args.llm_fixture, latency=Latency(args.llm_latency, args.jitter, seed=2), record=args.record,
+    )
+    real_llm = agent_module.ChatGoogleGenerativeAI
+
+    def make_llm(**kwargs):
+        if args.record:
+            llm.upstream = real_llm(**kwargs)
+        return llm
+
+    # Patch the two upstreams; everything in between (cache, singleflight, tools,
+    # package ranking, context budget, graph) runs for real
+    serp_client.search = serp
+    agent_module.ChatGoogleGenerativeAI = make_llm
+    # Keep fixture data out of the real on-disk cache
+    serp_cache._cache = serp_cache.SerpCache(":memory:")
+    if not args.warm_cache:
+        os.environ["SERPAPI_CACHE_BYPASS"] = "1"
+
+    agent = agent_module.Agent(checkpointer=MemorySaver(), prefetch=not args.no_prefetch)
+    return agent, serp, llm
+
+
+def run_once(agent, llm):
+    """One graph run; returns (elapsed s, {node: s}, final messages, llm calls)."""
+    config = {"configurable": {"thread_id": f"bench-{uuid.uuid4().hex}", "trip_context": TRIP}}
+    calls_before = len(llm.usage)
+    nodes = {}
+    start = last = time.perf_counter()
+    for update in agent.graph.stream(
+        {"messages": [HumanMessage(content=TRIP.user_message())]}, config=config, stream_mode="updates"
+    ):
+        now = time.perf_counter()
+        # Updates arrive as each node finishes, so the gap is that node's run time
+        for node in update:
+            nodes[node] = nodes.get(node, 0.0) + (now - last)
+        last = now
+    elapsed = time.perf_counter() - start
+    messages = agent.graph.get_state(config).values["messages"]
+    return elapsed, nodes, messages, llm.usage[calls_before:]
+
+
+def bench_parse(content, iterations=50):
+    """Milliseconds to parse + validate the final itinerary, whole and streamed in 40-char chunks."""
+    start = time.perf_counter()
+    for _ in range(iterations):
+        validate_itinerary(parse_itinerary(content))
+        parser = ItineraryStreamParser()
+        for i in range(0, len(content), 40):
+            parser.feed(content[i:i + 40])
+    return (time.perf_counter() - start) / iterations * 1000
+
+
+def bench_render(content, iterations=50):
+    """Milliseconds to render the results page (memoization bypassed)."""
+    itinerary = parse_itinerary(content)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        _render(itinerary)
+    return (time.perf_counter() - start) / iterations * 1000
+
+
+def collect(args):
+    agent, serp, llm = build_agent(args)
+    for _ in range(args.warmup):
+        run_once(agent, llm)
+
+    e2e, node_times, prompt_tokens, peaks = [], {}, [], []
+    final = None
+    for _ in range(args.runs):
+        tracemalloc.start()
+        elapsed, nodes, messages, usage = run_once(agent, llm)
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+
+        e2e.append(elapsed * 1000)
+        for node, seconds in nodes.items():
+            node_times.setdefault(node, []).append(seconds * 1000)
+        prompt_tokens.append(sum(p for p, _ in usage))
+        final = messages
+
+    if args.record:
+        llm.save()
+        print(f"Recorded {len(llm.responses)} LLM responses and {serp.calls} SerpAPI responses", file=sys.stderr)
+
+    content = agent_module.itinerary_text(final) or ""
+    return {
+        "runs": args.runs,
+        "e2e_p50_ms": round(percentile(e2e, 50), 1),
+        "e2e_p95_ms": round(percentile(e2e, 95), 1),
+        "nodes_ms": {node: round(statistics.mean(times), 1) for node, times in node_times.items()},
+        "prompt_tokens": round(statistics.mean(prompt_tokens)),
+        "llm_calls": len(llm.usage) // max(args.runs + args.warmup, 1),
+        "serp_calls": serp.calls // max(args.runs + args.warmup, 1),
+        "peak_memory_kb": round(statistics.median(peaks) / 1024),
+        "parse_ms": round(bench_parse(content), 3),
+        "render_ms": round(bench_render(content), 3),
+    }
+
+
+def regressions(result, baseline):
+    problems = []
+    for metric, tolerance in TOLERANCE.items():
+        before, after = baseline.get(metric), result.get(metric)
+        if before and after is not None and after > before * (1 + tolerance):
+            problems.append(f"{metric}: {after} vs baseline {before} (+{after / before - 1:.0%}, allowed +{tolerance:.0%})")
+    return problems
+
+
+def report(result):
+    print(f"end-to-end     p50 {result['e2e_p50_ms']:>9.1f} ms   p95 {result['e2e_p95_ms']:>9.1f} ms   ({result['runs']} runs)")
+    for node, ms in result["nodes_ms"].items():
+        print(f"  {node:<14} {ms:>9.1f} ms")
+    print(f"prompt tokens  {result['prompt_tokens']:>9} per run ({result['llm_calls']} LLM calls, {result['serp_calls']} SerpAPI calls)")
+    print(f"peak memory    {result['peak_memory_kb']:>9} KiB per run (tracemalloc)")
+    print(f"parse          {result['parse_ms']:>9.3f} ms per itinerary")
+    print(f"render         {result['render_ms']:>9.3f} ms per itinerary")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline agent benchmark with recorded SerpAPI/Gemini responses.")
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--serp-latency", type=float, default=0.0, help="Injected seconds per SerpAPI call")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="Injected seconds per LLM call")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Latency jitter as a fraction, e.g. 0.2")
+    parser.add_argument("--no-prefetch", action="store_true", help="Let the LLM request the searches")
+    parser.add_argument("--warm-cache", action="store_true", help="Serve repeat searches from the SerpAPI cache")
+    parser.add_argument("--llm-fixture", default=DEFAULT_LLM_FIXTURE)
+    parser.add_argument("--record", action="store_true", help="Call the live APIs once and save fixtures")
+    parser.add_argument("--json", action="store_true", help="Print the result as JSON")
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--check", action="store_true", help="Exit 1 if a metric regressed past its tolerance")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    args = parser.parse_args(argv)
+    if args.record:
+        args.runs, args.warmup = 1, 0
+
+    result = collect(args)
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        report(result)
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+            f.write("\n")
+        print(f"Baseline saved to {args.baseline}", file=sys.stderr)
+
+    if args.check:
+        if not os.path.exists(args.baseline):
+            sys.exit(f"No baseline at {args.baseline}; create one with --save-baseline")
+        with open(args.baseline, encoding="utf-8") as f:
+            problems = regressions(result, json.load(f))
+        for problem in problems:
+            print(f"REGRESSION {problem}", file=sys.stderr)
+        sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
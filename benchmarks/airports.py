@@ -0,0 +1,56 @@
+"""
+Microbenchmark for the airport resolver.
+
+    python -m benchmarks.airports
+"""
+import json
+import os
+import tempfile
+import time
+
+from airports import AIRPORTS, AirportIndex, normalize
+
+# Mix of exact, accented, alias, code, prefix and misspelled queries
+QUERIES = [
+    "Paris", "new york", "São Paulo", "zurich", "Zürich", "CDG", "bcn",
+    "bali", "kyoto", "washington dc", "Ho Chi Minh City", "saigon",
+    "barc", "lisb", "tokio", "Amsterdm", "Reykjavik", "cape town",
+]
+
+
+def bench(label, fn, iterations, ops_per_call=1):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    elapsed = time.perf_counter() - start
+    ops = iterations * ops_per_call
+    print(f"{label:<32} {ops / elapsed:>12,.0f} ops/s {elapsed / ops * 1e6:>10.2f} us/op")
+
+
+def main():
+    # The old per-call path: json.load a 100-entry city -> IATA file, then exact match
+    mapping = {a.city.lower(): a.iata for a in AIRPORTS.airports if a.rank == 1}
+    with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as f:
+        json.dump(dict(list(mapping.items())[:100]), f)
+
+    def legacy_lookup():
+        with open(f.name, encoding="utf-8") as fh:
+            return json.load(fh).get("paris")
+
+    uncached = AIRPORTS._lookup.__wrapped__
+    keys = [(normalize(q), q.strip()) for q in QUERIES]
+    n = len(QUERIES)
+
+    try:
+        bench("index load (mmap + build)", AirportIndex, 20)
+        bench("legacy json load + lookup", legacy_lookup, 2000)
+        bench("lookup (memoized)", lambda: [AIRPORTS.lookup(q) for q in QUERIES], 2000, n)
+        bench("lookup (uncached, incl. fuzzy)", lambda: [uncached(AIRPORTS, *k) for k in keys], 200, n)
+        bench("prefix search", lambda: AIRPORTS.search("san"), 5000)
+        bench("nearest major airport", lambda: AIRPORTS.nearest(48.86, 2.35), 2000)
+    finally:
+        os.unlink(f.name)
+
+
+if __name__ == "__main__":
+    main()
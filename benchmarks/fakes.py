@@ -0,0 +1,143 @@
+"""
+Record/replay stand-ins for SerpAPI and Gemini.
+
+ReplaySerp replaces serp_client.search and ReplayChatModel replaces
+ChatGoogleGenerativeAI, both serving fixtures from benchmarks/fixtures with
+optional injected latency. In record mode they wrap the real clients and
+write what they receive back to the fixtures directory.
+"""
+import json
+import os
+import random
+import threading
+import time
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+import serp_cache
+from token_count import message_tokens
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+
+# Fallback fixture per SerpAPI engine when there is no recording for the exact search
+DEFAULT_SERP_FIXTURES = {
+    "google_hotels": "serpapi_hotels_paris.json",
+    "google_flights": "serpapi_flights_jfk_cdg.json",
+}
+DEFAULT_LLM_FIXTURE = "gemini_paris.json"
+
+
+def load_fixture(name):
+    with open(os.path.join(FIXTURES, name), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_fixture(name, data):
+    with open(os.path.join(FIXTURES, name), "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+        f.write("\n")
+
+
+class Latency:
+    """Injected delay: `seconds` ± `jitter` (a fraction), from a seeded RNG."""
+
+    def __init__(self, seconds=0.0, jitter=0.0, seed=0):
+        self.seconds = seconds
+        self.jitter = jitter
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sleep(self):
+        if self.seconds <= 0:
+            return
+        with self._lock:
+            factor = 1 + self._random.uniform(-self.jitter, self.jitter)
+        time.sleep(self.seconds * factor)
+
+
+class ReplaySerp:
+    """Drop-in for serp_client.search(params)."""
+
+    def __init__(self, latency=None, record=False, upstream=None):
+        self.latency = latency or Latency()
+        self.record = record
+        self.upstream = upstream
+        self.calls = 0
+        self._fixtures = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def fixture_name(params):
+        return f"serpapi_{params.get('engine', 'search')}_{serp_cache.cache_key(params)[:12]}.json"
+
+    def __call__(self, params):
+        with self._lock:
+            self.calls += 1
+        name = self.fixture_name(params)
+        if self.record:
+            data = self.upstream(params)
+            save_fixture(name, data)
+            return data
+
+        self.latency.sleep()
+        if not os.path.exists(os.path.join(FIXTURES, name)):
+            name = DEFAULT_SERP_FIXTURES[params.get("engine")]
+        with self._lock:
+            if name not in self._fixtures:
+                self._fixtures[name] = load_fixture(name)
+            return self._fixtures[name]
+
+
+class ReplayChatModel:
+    """
+    Stand-in for ChatGoogleGenerativeAI. The n-th model turn after the last
+    human message gets the n-th recorded response (the last one repeats), so
+    a fixture is [tool calls, itinerary] and works with or without prefetch.
+    """
+
+    def __init__(self, fixture=DEFAULT_LLM_FIXTURE, latency=None, record=False, upstream=None):
+        self.fixture = fixture
+        self.latency = latency or Latency()
+        self.record = record
+        self.upstream = upstream
+        self.responses = [] if record else load_fixture(fixture)["responses"]
+        # (prompt tokens, completion tokens) per call
+        self.usage = []
+        self._lock = threading.Lock()
+
+    def bind_tools(self, tools):
+        if self.record:
+            bound = ReplayChatModel(self.fixture, self.latency, record=True, upstream=self.upstream.bind_tools(tools))
+            bound.responses, bound.usage, bound._lock = self.responses, self.usage, self._lock
+            return bound
+        return self
+
+    @staticmethod
+    def _turn(messages):
+        turn = 0
+        for m in reversed(messages):
+            if isinstance(m, HumanMessage):
+                break
+            if isinstance(m, AIMessage):
+                turn += 1
+        return turn
+
+    def invoke(self, messages, config=None, **kwargs):
+        turn = self._turn(messages)
+        if self.record:
+            message = self.upstream.invoke(messages, config, **kwargs)
+            with self._lock:
+                while len(self.responses) <= turn:
+                    self.responses.append(None)
+                self.responses[turn] = {"content": message.content, "tool_calls": message.tool_calls}
+        else:
+            self.latency.sleep()
+            response = self.responses[min(turn, len(self.responses) - 1)]
+            message = AIMessage(content=response["content"], tool_calls=response.get("tool_calls", []))
+
+        with self._lock:
+            self.usage.append((message_tokens(messages), message_tokens([message])))
+        return message
+
+    def save(self):
+        save_fixture(self.fixture, {"model": "gemini-1.5-flash", "responses": self.responses})
@@ -0,0 +1,47 @@
+"""
+Prompt-token report for tool results: raw SerpAPI dicts (previous str()
+ToolMessage content) vs. compact result models.
+
+    python -m benchmarks.tokens
+"""
+import json
+import os
+
+from token_count import estimate_tokens
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+def load_fixture(name):
+    with open(os.path.join(FIXTURES, name), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def main():
+    from agent import tool_content
+    from flight_tool import FlightResult
+    from hotel_tool import HotelResult
+
+    hotels = load_fixture("serpapi_hotels_paris.json")
+    flights = load_fixture("serpapi_flights_jfk_cdg.json")
+    link = flights["search_metadata"]["google_flights_url"]
+
+    rows = [
+        ("hotels_finder", str(hotels["properties"][:5]),
+         tool_content([HotelResult.from_serpapi(p) for p in hotels["properties"][:5]])),
+        ("flights_finder", str(flights["best_flights"][:5]),
+         tool_content([FlightResult.from_serpapi(f, link) for f in flights["best_flights"][:5]])),
+    ]
+
+    print(f"{'tool':<16} {'before':>8} {'after':>8} {'saved':>7}")
+    total_before = total_after = 0
+    for name, before, after in rows:
+        b, a = estimate_tokens(before), estimate_tokens(after)
+        total_before += b
+        total_after += a
+        print(f"{name:<16} {b:>8} {a:>8} {1 - a / b:>7.0%}")
+    print(f"{'per tool round':<16} {total_before:>8} {total_after:>8} {1 - total_after / total_before:>7.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Disk-backed LangGraph checkpointer with a retention policy.
+
+Checkpoints live in SQLite (WAL mode) so sessions survive restarts and the
+process does not grow with every conversation. Retention:
+- only the newest CHECKPOINT_MAX_PER_THREAD checkpoints of a thread are kept
+- threads idle for longer than CHECKPOINT_TTL seconds are deleted
+- the file is compacted (WAL truncate + VACUUM) after expiring threads
+"""
+import os
+import sqlite3
+import threading
+import time
+
+from langgraph.checkpoint.sqlite import SqliteSaver
+
+# Constants
+CHECKPOINT_PATH = os.getenv("CHECKPOINT_PATH", ".cache/checkpoints.sqlite3")
+CHECKPOINT_MAX_PER_THREAD = int(os.getenv("CHECKPOINT_MAX_PER_THREAD", "5"))
+CHECKPOINT_TTL = int(os.getenv("CHECKPOINT_TTL", str(7 * 24 * 3600)))
+COMPACT_EVERY = int(os.getenv("CHECKPOINT_COMPACT_EVERY", "500"))
+
+
+class RetentionSqliteSaver(SqliteSaver):
+    def __init__(self, conn, max_per_thread=CHECKPOINT_MAX_PER_THREAD, ttl=CHECKPOINT_TTL,
+                 compact_every=COMPACT_EVERY):
+        super().__init__(conn)
+        self.max_per_thread = max_per_thread
+        self.ttl = ttl
+        self.compact_every = compact_every
+        self._puts = 0
+        self._puts_lock = threading.Lock()
+
+    def setup(self):
+        if self.is_setup:
+            return
+        super().setup()
+        self.conn.executescript(
+            """
+            PRAGMA journal_mode=WAL;
+            PRAGMA synchronous=NORMAL;
+            CREATE TABLE IF NOT EXISTS thread_activity (
+                thread_id TEXT PRIMARY KEY,
+                updated_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS thread_activity_updated ON thread_activity(updated_at);
+            """
+        )
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        next_config = super().put(config, checkpoint, metadata, new_versions)
+        thread_id = str(config["configurable"]["thread_id"])
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+
+        with self.cursor() as cur:
+            cur.execute(
+                "INSERT OR REPLACE INTO thread_activity (thread_id, updated_at) VALUES (?, ?)",
+                (thread_id, time.time()),
+            )
+            self._prune_thread(cur, thread_id, checkpoint_ns)
+
+        with self._puts_lock:
+            self._puts += 1
+            due = self._puts % self.compact_every == 0
+        if due:
+            self.compact()
+        return next_config
+
+    def _prune_thread(self, cur, thread_id, checkpoint_ns):
+        # Checkpoint ids are time-ordered (uuid6): keep the newest, drop the rest
+        cur.execute(
+            """
+            SELECT checkpoint_id FROM checkpoints
+            WHERE thread_id = ? AND checkpoint_ns = ?
+            ORDER BY checkpoint_id DESC LIMIT -1 OFFSET ?
+            """,
+            (thread_id, checkpoint_ns, self.max_per_thread),
+        )
+        stale = [(thread_id, checkpoint_ns, row[0]) for row in cur.fetchall()]
+        if stale:
+            where = "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?"
+            cur.executemany(f"DELETE FROM checkpoints {where}", stale)
+            cur.executemany(f"DELETE FROM writes {where}", stale)
+
+    def compact(self):
+        """Delete threads idle for longer than the TTL and reclaim disk space."""
+        cutoff = time.time() - self.ttl
+        with self.cursor() as cur:
+            cur.execute("SELECT thread_id FROM thread_activity WHERE updated_at < ?", (cutoff,))
+            expired = [(row[0],) for row in cur.fetchall()]
+            for table in ("checkpoints", "writes", "thread_activity"):
+                cur.executemany(f"DELETE FROM {table} WHERE thread_id = ?", expired)
+
+        if expired:
+            with self.lock:
+                self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+                self.conn.execute("VACUUM")
+        return len(expired)
+
+
+def get_checkpointer(path=CHECKPOINT_PATH):
+    if path != ":memory:":
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    # Shared by the Streamlit script threads and the tool pool; SqliteSaver serializes access with its lock
+    conn = sqlite3.connect(path, check_same_thread=False)
+    saver = RetentionSqliteSaver(conn)
+    saver.setup()
+    saver.compact()
+    return saver
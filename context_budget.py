@@ -0,0 +1,83 @@
+"""
+Prompt budget policy for the agent loop.
+
+AgentState.messages only grows (operator.add), so call_tools_llm sends the
+messages through fit_messages() first:
+- ToolMessages from the latest tool round are sent as-is
+- older ToolMessages are collapsed into short summaries
+- if the prompt is still over budget, the oldest tool rounds are dropped
+  (an AI tool-call message is always dropped together with its results)
+The stored state is untouched; only the prompt is trimmed.
+"""
+import json
+import os
+
+from langchain_core.messages import AIMessage, ToolMessage
+
+from token_count import message_tokens
+
+# Constants
+MAX_PROMPT_TOKENS = int(os.getenv("MAX_PROMPT_TOKENS", "8000"))
+MAX_TOOL_ROUNDS = int(os.getenv("MAX_TOOL_ROUNDS", "3"))
+SUMMARY_ITEMS = 2
+SUMMARY_CHARS = 300
+
+
+def tool_rounds(messages):
+    """Number of tool-calling AI turns since the last human message."""
+    rounds = 0
+    for m in reversed(messages):
+        if m.type == "human":
+            break
+        if isinstance(m, AIMessage) and m.tool_calls:
+            rounds += 1
+    return rounds
+
+
+def summarize_tool_message(message):
+    """Keep the first few options of a JSON result list, or a prefix of anything else."""
+    try:
+        items = json.loads(message.content)
+    except (TypeError, ValueError):
+        items = None
+    if isinstance(items, list):
+        summary = json.dumps(items[:SUMMARY_ITEMS], ensure_ascii=False, separators=(",", ":"))
+        if len(items) > SUMMARY_ITEMS:
+            summary += f" (+{len(items) - SUMMARY_ITEMS} more earlier results omitted)"
+    else:
+        summary = str(message.content)[:SUMMARY_CHARS]
+    return ToolMessage(tool_call_id=message.tool_call_id, name=message.name, content=summary)
+
+
+def _split_rounds(messages):
+    """[(AIMessage, [ToolMessage, ...]) or (other message, [])] in order."""
+    groups = []
+    for m in messages:
+        if isinstance(m, ToolMessage) and groups and groups[-1][0].type == "ai":
+            groups[-1][1].append(m)
+        else:
+            groups.append((m, []))
+    return groups
+
+
+def _flatten(groups):
+    return [msg for m, tools in groups for msg in [m] + tools]
+
+
+def fit_messages(messages, budget=MAX_PROMPT_TOKENS):
+    groups = _split_rounds(messages)
+    last_round = max((i for i, (m, tools) in enumerate(groups) if tools), default=None)
+
+    fitted = [
+        (m, tools if i == last_round else [summarize_tool_message(t) for t in tools])
+        for i, (m, tools) in enumerate(groups)
+    ]
+
+    # Drop the oldest tool rounds (never human messages or the latest round) until we fit
+    while message_tokens(_flatten(fitted)) > budget:
+        older = [i for i, (m, tools) in enumerate(fitted) if tools and i != last_round]
+        if not older:
+            break
+        del fitted[older[0]]
+        last_round -= 1
+    return _flatten(fitted)
@@ -0,0 +1,120 @@
+"""
+Flexible-date search.
+
+For a trip with dates that may move by ±N days, every (outbound, return)
+pair in the window is searched concurrently and the cheapest flight and
+hotel prices are collected into (outbound x return) NumPy matrices. The
+combined matrix gives the cheapest trip, a ranking of date options and a
+heatmap-ready grid.
+"""
+import datetime
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, replace
+
+import numpy as np
+
+from flight_tool import FlightsInput, flights_finder
+from hotel_tool import HotelsInput, hotels_finder
+from prices import parse_price
+from trip_context import fill_tool_args
+
+# Constants
+MAX_FLEX_DAYS = 3
+FLEX_MAX_WORKERS = int(os.getenv("FLEX_MAX_WORKERS", "8"))
+
+
+@dataclass
+class FlexResult:
+    outbound_dates: list
+    return_dates: list
+    flight_prices: np.ndarray
+    hotel_prices: np.ndarray
+
+    @property
+    def total_prices(self):
+        # NaN (invalid pair or failed search) propagates, so only complete trips rank
+        return self.flight_prices + self.hotel_prices
+
+    def ranked(self, limit=5):
+        totals = self.total_prices
+        valid = np.argwhere(~np.isnan(totals))
+        order = np.argsort(totals[~np.isnan(totals)], kind="stable")[:limit]
+        options = []
+        for i, j in valid[order]:
+            outbound = self.outbound_dates[i]
+            ret = self.return_dates[j]
+            options.append({
+                "outbound_date": outbound,
+                "return_date": ret,
+                "nights": (datetime.date.fromisoformat(ret) - datetime.date.fromisoformat(outbound)).days,
+                "flight_price": float(self.flight_prices[i, j]),
+                "hotel_price": float(self.hotel_prices[i, j]),
+                "total": float(totals[i, j]),
+            })
+        return options
+
+    def cheapest(self):
+        options = self.ranked(limit=1)
+        return options[0] if options else None
+
+    def grid(self):
+        """Heatmap-ready totals: rows are outbound dates, columns return dates, None for gaps."""
+        totals = self.total_prices
+        return {
+            "outbound_dates": self.outbound_dates,
+            "return_dates": self.return_dates,
+            "total": np.where(np.isnan(totals), None, totals).tolist(),
+        }
+
+
+def date_window(center, flex_days):
+    day = datetime.date.fromisoformat(str(center))
+    return [str(day + datetime.timedelta(days=d)) for d in range(-flex_days, flex_days + 1)]
+
+
+def _cheapest_flight(ctx):
+    results = flights_finder.invoke({"params": FlightsInput(**fill_tool_args("flights_finder", {}, ctx))})
+    prices = [parse_price(r.price) for r in results]
+    return min((p for p in prices if p is not None), default=np.nan)
+
+
+def _cheapest_hotel(ctx):
+    results = hotels_finder.invoke({"params": HotelsInput(**fill_tool_args("hotels_finder", {}, ctx))})
+    prices = [parse_price(r.total_price) for r in results]
+    return min((p for p in prices if p is not None), default=np.nan)
+
+
+def _safe(fn, ctx):
+    try:
+        return fn(ctx)
+    except Exception:
+        return np.nan
+
+
+def flexible_search(ctx, flex_days=1, max_workers=FLEX_MAX_WORKERS):
+    """Search every date pair within ±flex_days of the trip's dates."""
+    flex_days = max(0, min(int(flex_days), MAX_FLEX_DAYS))
+    outbound_dates = date_window(ctx.start_date, flex_days)
+    return_dates = date_window(ctx.end_date, flex_days)
+
+    flight_prices = np.full((len(outbound_dates), len(return_dates)), np.nan)
+    hotel_prices = np.full_like(flight_prices, np.nan)
+
+    # Past outbound dates cannot be booked; searching them only costs quota
+    today = str(datetime.date.today())
+    pairs = [(i, j) for i, out in enumerate(outbound_dates) for j, ret in enumerate(return_dates)
+             if out >= today and ret > out]
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="flex") as executor:
+        futures = {}
+        for i, j in pairs:
+            pair_ctx = replace(ctx, start_date=outbound_dates[i], end_date=return_dates[j])
+            futures[(i, j)] = (
+                executor.submit(_safe, _cheapest_flight, pair_ctx) if ctx.origin else None,
+                executor.submit(_safe, _cheapest_hotel, pair_ctx),
+            )
+        for (i, j), (flight, hotel) in futures.items():
+            flight_prices[i, j] = flight.result() if flight else 0.0
+            hotel_prices[i, j] = hotel.result()
+
+    return FlexResult(outbound_dates, return_dates, flight_prices, hotel_prices)
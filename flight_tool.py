@@ -1,19 +1,57 @@
 import os
+from dataclasses import asdict, dataclass
 from typing import Optional
 
-import serpapi
 from langchain.pydantic_v1 import BaseModel, Field
 from langchain_core.tools import tool
+
+import serp_cache
+
 class FlightsInput(BaseModel):
     departure_airport: Optional[str] = Field(description='Departure airport code (IATA)')
     arrival_airport: Optional[str] = Field(description='Arrival airport code (IATA)')
     outbound_date: Optional[str] = Field(description='Parameter defines the outbound date. The format is YYYY-MM-DD. e.g. 2024-06-22')
-    return_date: Optional[str] = Field(description='Parameter defines the return date. The format is YYYY-MM-DD. e.g. 2024-06-28')
+    return_date: Optional[str] = Field(description='Parameter defines the return date. The format is YYYY-MM-DD. e.g. 2024-06-28. Leave empty for a one-way flight.')
     adults: Optional[int] = Field(1, description='Parameter defines the number of adults. Default to 1.')
     children: Optional[int] = Field(0, description='Parameter defines the number of children. Default to 0.')
 
 
 
+@dataclass
+class FlightResult:
+    """Compact flight option: one SerpAPI best_flights entry, segments collapsed."""
+    airline: str
+    departure_airport: Optional[str] = None
+    arrival_airport: Optional[str] = None
+    departure_time: Optional[str] = None
+    arrival_time: Optional[str] = None
+    stops: int = 0
+    duration: Optional[int] = None
+    price: Optional[str] = None
+    link: Optional[str] = None
+
+    @classmethod
+    def from_serpapi(cls, option, link=None):
+        segments = option.get('flights') or [{}]
+        first, last = segments[0], segments[-1]
+        airlines = list(dict.fromkeys(s.get('airline') for s in segments if s.get('airline')))
+        price = option.get('price')
+        return cls(
+            airline=' / '.join(airlines),
+            departure_airport=first.get('departure_airport', {}).get('id'),
+            arrival_airport=last.get('arrival_airport', {}).get('id'),
+            departure_time=first.get('departure_airport', {}).get('time'),
+            arrival_time=last.get('arrival_airport', {}).get('time'),
+            stops=len(option.get('layovers') or []),
+            duration=option.get('total_duration'),
+            price=f'${price}' if price is not None else None,
+            link=link,
+        )
+
+    def to_dict(self):
+        return {k: v for k, v in asdict(self).items() if v is not None}
+
+
 class FlightsInputSchema(BaseModel):
     params: FlightsInput
 
@@ -24,9 +62,10 @@ def flights_finder(params: FlightsInput):
     Find flights using the Google Flights engine.
 
     Returns:
-        dict: Flight search results.
+        list[FlightResult]: All flight options; the agent ranks them.
     '''
 
+    return_date = params.return_date
     params = {
         'api_key': os.getenv('SERPAPI_API_KEY'),
         'engine': 'google_flights',
@@ -35,16 +74,21 @@ def flights_finder(params: FlightsInput):
         'departure_id': params.departure_airport,
         'arrival_id': params.arrival_airport,
         'outbound_date': params.outbound_date,
-        'return_date': params.return_date,
+        'return_date': return_date,
         'currency': 'USD',
         'adults': params.adults,
         'stops': '1',
         'children': params.children
     }
+    if not return_date:
+        # One-way search (the default type 1 is a round trip)
+        del params['return_date']
+        params['type'] = '2'
 
-    search = serpapi.search(params)
-    results = search.data
-    return results['best_flights'][:5]
+    results = serp_cache.search(params, ttl=serp_cache.FLIGHTS_TTL)
+    link = results.get('search_metadata', {}).get('google_flights_url')
+    options = results.get('best_flights', []) + results.get('other_flights', [])
+    return [FlightResult.from_serpapi(f, link) for f in options]
 
 
 
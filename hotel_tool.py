@@ -1,10 +1,12 @@
 import os
+from dataclasses import asdict, dataclass
 from typing import Optional
 
-import serpapi
 from langchain.pydantic_v1 import BaseModel, Field
 from langchain_core.tools import tool
 
+import serp_cache
+
 
 # from pydantic import BaseModel, Field
 
@@ -21,6 +23,33 @@ class HotelsInput(BaseModel):
         None, description='Parameter defines to include only certain hotel class in the results. for example- 2,3,4')
 
 
+@dataclass
+class HotelResult:
+    """Compact hotel option: only what the itinerary needs from a SerpAPI property."""
+    name: str
+    rating: Optional[float] = None
+    hotel_class: Optional[int] = None
+    price_per_night: Optional[str] = None
+    total_price: Optional[str] = None
+    link: Optional[str] = None
+    check_in_time: Optional[str] = None
+
+    @classmethod
+    def from_serpapi(cls, prop):
+        return cls(
+            name=prop.get('name', ''),
+            rating=prop.get('overall_rating'),
+            hotel_class=prop.get('extracted_hotel_class'),
+            price_per_night=(prop.get('rate_per_night') or {}).get('lowest'),
+            total_price=(prop.get('total_rate') or {}).get('lowest'),
+            link=prop.get('link'),
+            check_in_time=prop.get('check_in_time'),
+        )
+
+    def to_dict(self):
+        return {k: v for k, v in asdict(self).items() if v is not None}
+
+
 class HotelsInputSchema(BaseModel):
     params: HotelsInput
 
@@ -31,7 +60,7 @@ def hotels_finder(params: HotelsInput):
     Find hotels using the Google Hotels engine.
 
     Returns:
-        dict: Hotel search results.
+        list[HotelResult]: All hotel options; the agent ranks them.
     '''
 
     params = {
@@ -50,7 +79,6 @@ def hotels_finder(params: HotelsInput):
         'hotel_class': params.hotel_class
     }
 
-    search = serpapi.search(params)
-    results = search.data
-    return results['properties'][:5]
+    results = serp_cache.search(params, ttl=serp_cache.HOTELS_TTL)
+    return [HotelResult.from_serpapi(p) for p in results.get('properties', [])]
 
@@ -0,0 +1,213 @@
+"""
+In-process tracing and metrics.
+
+span("stage") times a block of work: the duration goes into a per-stage
+histogram, exceptions into an error counter, and the finished span into an
+optional JSONL trace file (TRACE_PATH) and into the span list of the
+enclosing collect() block, which is how the Streamlit debug panel gets the
+timings of one request. METRICS_PORT starts a Prometheus text endpoint.
+
+Spans opened on worker threads only reach a collect() block if the work was
+submitted with the caller's context (see submit_with_context).
+"""
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Constants
+TRACE_PATH = os.getenv("TRACE_PATH", "")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+STAGE_BUCKETS = (0.005, 0.025, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60)
+PREFIX = "tripgenie"
+
+_spans = contextvars.ContextVar("spans", default=None)
+_parent = contextvars.ContextVar("parent_span", default=None)
+
+
+class Histogram:
+    def __init__(self, buckets=STAGE_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.sum += value
+        self.count += 1
+        index = next((i for i, b in enumerate(self.buckets) if value <= b), len(self.buckets))
+        self.counts[index] += 1
+
+
+class Registry:
+    """Labelled counters and histograms, exportable as Prometheus text."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def prometheus(self):
+        lines = []
+        with self._lock:
+            for name in sorted({n for n, _ in self.counters}):
+                lines.append(f"# TYPE {PREFIX}_{name} counter")
+                for (n, labels), value in sorted(self.counters.items()):
+                    if n == name:
+                        lines.append(f"{PREFIX}_{name}{_labels(labels)} {value}")
+            for name in sorted({n for n, _ in self.histograms}):
+                lines.append(f"# TYPE {PREFIX}_{name} histogram")
+                for (n, labels), h in sorted(self.histograms.items()):
+                    if n != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip([*map(str, h.buckets), "+Inf"], h.counts):
+                        cumulative += count
+                        lines.append(f"{PREFIX}_{name}_bucket{_labels(labels + (('le', bound),))} {cumulative}")
+                    lines.append(f"{PREFIX}_{name}_sum{_labels(labels)} {h.sum:.6f}")
+                    lines.append(f"{PREFIX}_{name}_count{_labels(labels)} {h.count}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{str(v)}"' for k, v in labels) + "}"
+
+
+METRICS = Registry()
+_trace_lock = threading.Lock()
+
+
+def _write_trace(record):
+    if not TRACE_PATH:
+        return
+    line = json.dumps(record, ensure_ascii=False, default=str)
+    with _trace_lock:
+        os.makedirs(os.path.dirname(TRACE_PATH) or ".", exist_ok=True)
+        with open(TRACE_PATH, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+@contextmanager
+def span(stage, **attrs):
+    """
+    Time a stage. The yielded dict can be updated with attributes (token
+    counts, cache results, ...) before the block ends.
+    """
+    span_id = uuid.uuid4().hex[:16]
+    parent = _parent.get()
+    token = _parent.set(span_id)
+    start_wall = time.time()
+    start = time.perf_counter()
+    error = None
+    try:
+        yield attrs
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        _parent.reset(token)
+        METRICS.observe("stage_seconds", elapsed, stage=stage)
+        if error:
+            METRICS.inc("errors_total", stage=stage, error=error)
+        record = {
+            "span_id": span_id, "parent_id": parent, "stage": stage,
+            "start": round(start_wall, 6), "duration_ms": round(elapsed * 1000, 3),
+            "thread": threading.current_thread().name, "error": error, **attrs,
+        }
+        spans = _spans.get()
+        if spans is not None:
+            spans.append(record)
+        _write_trace(record)
+
+
+def timed(stage):
+    """Decorator form of span()."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def count_tokens(stage, prompt=0, completion=0):
+    METRICS.inc("tokens_total", prompt, stage=stage, kind="prompt")
+    METRICS.inc("tokens_total", completion, stage=stage, kind="completion")
+
+
+@contextmanager
+def collect():
+    """Collect every span finished inside the block (and in work submitted with its context)."""
+    spans = []
+    token = _spans.set(spans)
+    try:
+        yield spans
+    finally:
+        _spans.reset(token)
+
+
+def submit_with_context(executor, fn, *args):
+    """executor.submit that keeps the caller's span collector and parent span."""
+    return executor.submit(contextvars.copy_context().run, fn, *args)
+
+
+def stage_summary(spans):
+    """{stage: (calls, total ms, max ms)} for a list of span records."""
+    summary = {}
+    for s in spans:
+        calls, total, longest = summary.get(s["stage"], (0, 0.0, 0.0))
+        summary[s["stage"]] = (calls + 1, total + s["duration_ms"], max(longest, s["duration_ms"]))
+    return summary
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = METRICS.prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port=METRICS_PORT):
+    """Serve /metrics on a background thread (once per process; no-op if port is 0)."""
+    global _server
+    with _server_lock:
+        if _server is None and port:
+            _server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsHandler)
+            threading.Thread(target=_server.serve_forever, name="metrics", daemon=True).start()
+            print(f"📈 Metrics on http://localhost:{port}/metrics")
+        return _server
@@ -0,0 +1,284 @@
+"""
+Semantic cache of generated itineraries.
+
+Trips are reduced to a canonical spec (origin and destination airports,
+number of nights, budget tier, interest and avoid sets, party shape). A new
+trip reuses a cached itinerary when the exact parts match and the interest
+and avoid sets are similar enough (Jaccard). Only the day plan is reused: the
+hotel and flight sections are re-searched for the new dates, because
+prices and availability change. The plan is written around the flight
+times, so a hit whose best flight is now a different one counts as stale
+and the trip is planned from scratch.
+"""
+import datetime
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from airports import normalize, resolve_airport
+from flight_tool import FlightsInput, flights_finder
+from hotel_tool import HotelsInput, hotels_finder
+from instrumentation import METRICS, span
+from itinerary_parser import validate_itinerary
+from package_optimizer import winners
+from trip_context import fill_tool_args
+
+# Constants
+ITINERARY_CACHE_ENABLED = os.getenv("ITINERARY_CACHE", "1") == "1"
+ITINERARY_CACHE_MAX_ENTRIES = int(os.getenv("ITINERARY_CACHE_MAX_ENTRIES", "512"))
+ITINERARY_CACHE_TTL = int(os.getenv("ITINERARY_CACHE_TTL", str(7 * 24 * 3600)))
+# Minimum Jaccard similarity of the interest / avoid sets for a hit
+INTEREST_THRESHOLD = float(os.getenv("ITINERARY_CACHE_INTEREST_THRESHOLD", "0.6"))
+AVOID_THRESHOLD = float(os.getenv("ITINERARY_CACHE_AVOID_THRESHOLD", "1.0"))
+# Allowed difference in nights; anything above 0 reuses plans with a different number of days
+NIGHTS_TOLERANCE = int(os.getenv("ITINERARY_CACHE_NIGHTS_TOLERANCE", "0"))
+
+_TERM_SPLIT = re.compile(r"[,;/+&\n]|\band\b")
+
+
+@dataclass(frozen=True)
+class TripSpec:
+    origin: str
+    destination: str
+    nights: int
+    budget: str
+    party: str
+    interests: frozenset
+    avoid: frozenset
+
+    @property
+    def bucket(self):
+        """The parts that must match exactly."""
+        return (self.origin, self.destination, self.budget, self.party)
+
+
+def _terms(text):
+    terms = set()
+    for part in _TERM_SPLIT.split(text or ""):
+        term = normalize(part)
+        # "museums" and "museum" are the same interest
+        if len(term) > 3 and term.endswith("s") and not term.endswith("ss"):
+            term = term[:-1]
+        if term:
+            terms.add(term)
+    return frozenset(terms)
+
+
+def _party(adults, children):
+    if children:
+        return "family"
+    return {1: "solo", 2: "couple"}.get(adults, "group")
+
+
+def trip_spec(ctx):
+    """Canonical spec of a TripContext, or None if it lacks a destination or valid dates."""
+    try:
+        nights = (datetime.date.fromisoformat(ctx.end_date) - datetime.date.fromisoformat(ctx.start_date)).days
+    except (TypeError, ValueError):
+        return None
+    # Multi-city plans depend on every stay; they are not cached
+    if not ctx.destination or ctx.legs or nights < 0:
+        return None
+    return TripSpec(
+        # A trip without an origin has no flight, so it must not reuse one that had
+        origin=(resolve_airport(ctx.origin) or normalize(ctx.origin)) if ctx.origin else "",
+        destination=resolve_airport(ctx.destination) or normalize(ctx.destination),
+        nights=nights,
+        budget=(ctx.budget or "Medium").lower(),
+        party=_party(ctx.adults, ctx.children),
+        interests=_terms(ctx.interests),
+        avoid=_terms(ctx.avoid),
+    )
+
+
+def jaccard(a, b):
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+class ItineraryCache:
+    """In-memory LRU + TTL cache of itinerary plans by TripSpec."""
+
+    def __init__(self, max_entries=ITINERARY_CACHE_MAX_ENTRIES, ttl=ITINERARY_CACHE_TTL,
+                 interest_threshold=INTEREST_THRESHOLD, avoid_threshold=AVOID_THRESHOLD,
+                 nights_tolerance=NIGHTS_TOLERANCE):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.interest_threshold = interest_threshold
+        self.avoid_threshold = avoid_threshold
+        self.nights_tolerance = nights_tolerance
+        # spec -> (expires_at, itinerary); order is least recently used first
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "stale": 0, "evictions": 0}
+
+    def _score(self, wanted, cached):
+        if cached.bucket != wanted.bucket or abs(cached.nights - wanted.nights) > self.nights_tolerance:
+            return None
+        interests = jaccard(wanted.interests, cached.interests)
+        avoid = jaccard(wanted.avoid, cached.avoid)
+        if interests < self.interest_threshold or avoid < self.avoid_threshold:
+            return None
+        # Prefer the closest trip length, then the closest interests
+        return (-abs(cached.nights - wanted.nights), interests, avoid)
+
+    def get(self, spec):
+        """The cached itinerary most similar to spec, or None."""
+        now = time.time()
+        with self._lock:
+            best, best_score = None, None
+            for cached, (expires_at, _) in list(self._entries.items()):
+                if expires_at <= now:
+                    del self._entries[cached]
+                    self.stats["evictions"] += 1
+                    continue
+                score = self._score(spec, cached)
+                if score is not None and (best_score is None or score > best_score):
+                    best, best_score = cached, score
+
+            result = "hit" if best is not None else "miss"
+            self.stats["hits" if best is not None else "misses"] += 1
+            METRICS.inc("itinerary_cache_total", result=result)
+            if best is None:
+                return None
+            self._entries.move_to_end(best)
+            return self._entries[best][1]
+
+    def put(self, spec, itinerary):
+        with self._lock:
+            self._entries[spec] = (time.time() + self.ttl, itinerary)
+            self._entries.move_to_end(spec)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def mark_stale(self):
+        """A hit from get() could not be reused after all."""
+        with self._lock:
+            self.stats["stale"] += 1
+        METRICS.inc("itinerary_cache_total", result="stale")
+
+    def hit_rate(self):
+        """Share of lookups that produced a reusable itinerary."""
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return (self.stats["hits"] - self.stats["stale"]) / lookups if lookups else None
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_itinerary_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ItineraryCache()
+        return _cache
+
+
+def _hotel_section(hotel):
+    return {k: v for k, v in {
+        "name": hotel.name,
+        "price_per_night": hotel.price_per_night,
+        "total_price": hotel.total_price,
+        "rating": hotel.rating,
+        "link": hotel.link,
+    }.items() if v is not None}
+
+
+# The fields the day plan depends on (landing time and airport, departure for the airport run)
+FLIGHT_SCHEDULE_FIELDS = ("airline", "departure_time", "arrival_time", "departure_airport", "arrival_airport")
+
+
+def _flight_section(flight, cached):
+    """
+    The cached flight section with the fresh price and link, or None if the
+    best flight is no longer the one the plan was written around.
+    """
+    # SerpAPI round-trip results describe the outbound leg and the total price
+    outbound = {
+        "airline": flight.airline,
+        "departure_time": (flight.departure_time or "")[-5:],
+        "arrival_time": (flight.arrival_time or "")[-5:],
+        "departure_airport": flight.departure_airport,
+        "arrival_airport": flight.arrival_airport,
+    }
+    cached_outbound = cached.get("outbound") if isinstance(cached, dict) else None
+    if not isinstance(cached_outbound, dict) or any(cached_outbound.get(k) != v for k, v in outbound.items()):
+        return None
+    # The return flight is not part of the search results; the cached one is kept
+    return dict(cached, outbound=dict(cached_outbound, price=flight.price, link=flight.link or cached_outbound.get("link")))
+
+
+def _rename_hotel(plan, old, new):
+    # Check-in/check-out activities name the hotel
+    renamed = []
+    for days in plan:
+        renamed.append({
+            day: [dict(a, description=a["description"].replace(old, new))
+                  if isinstance(a, dict) and isinstance(a.get("description"), str) else a
+                  for a in activities] if isinstance(activities, list) else activities
+            for day, activities in days.items()
+        } if isinstance(days, dict) else days)
+    return renamed
+
+
+def refresh_prices(itinerary, ctx):
+    """
+    Copy of a cached itinerary with hotel and flight re-searched for ctx; the
+    best hotel replaces the old one and the plan is kept. Returns None if the
+    best flight has a different schedule, since the plan is built around it.
+    """
+    hotels = hotels_finder.invoke({"params": HotelsInput(**fill_tool_args("hotels_finder", {}, ctx))})
+    flights = None
+    if ctx.origin:
+        flights = flights_finder.invoke({"params": FlightsInput(**fill_tool_args("flights_finder", {}, ctx))})
+    top_hotels, top_flights = winners(hotels, flights, ctx, k=1)
+
+    refreshed = dict(itinerary)
+    old_hotel = (itinerary.get("hotel") or {}).get("name")
+    if top_hotels:
+        refreshed["hotel"] = _hotel_section(top_hotels[0])
+        if old_hotel and old_hotel != top_hotels[0].name:
+            refreshed["plan"] = _rename_hotel(itinerary["plan"], old_hotel, top_hotels[0].name)
+    if top_flights:
+        refreshed["flight"] = _flight_section(top_flights[0], itinerary.get("flight"))
+        if refreshed["flight"] is None:
+            return None
+    return refreshed
+
+
+def reuse_itinerary(ctx):
+    """A cached itinerary adapted to ctx with fresh hotel/flight prices, or None on a miss."""
+    spec = trip_spec(ctx) if ITINERARY_CACHE_ENABLED else None
+    if spec is None:
+        return None
+    cached = get_itinerary_cache().get(spec)
+    if cached is None:
+        return None
+    try:
+        with span("itinerary_cache.refresh"):
+            refreshed = refresh_prices(cached, ctx)
+    except Exception as e:
+        # Fall back to a full agent run
+        print(f"⚠️ Could not refresh cached itinerary: {e}")
+        refreshed = None
+    if refreshed is None or validate_itinerary(refreshed):
+        get_itinerary_cache().mark_stale()
+        return None
+    return refreshed
+
+
+def remember_itinerary(ctx, itinerary):
+    spec = trip_spec(ctx) if ITINERARY_CACHE_ENABLED else None
+    if spec is not None and isinstance(itinerary.get("plan"), list) and itinerary["plan"]:
+        get_itinerary_cache().put(spec, itinerary)
@@ -0,0 +1,313 @@
+"""
+Incremental parsing and validation of the itinerary JSON produced by the LLM.
+
+The model is asked (see the output_format section in prompts.py) for one JSON object with
+"general", "hotel", "flight" and "plan" keys, but in practice it may wrap
+it in ```json fences, add text around it or leave small syntax errors.
+"""
+import json
+import re
+
+from instrumentation import timed
+
+SECTIONS = ("general", "hotel", "flight")
+
+_FENCE = re.compile(r"```(?:json)?", re.IGNORECASE)
+# A brace that can open the itinerary object (prose like "{note}" cannot)
+_OBJECT_START = re.compile(r'\{\s*["}]')
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+_SMART_QUOTES = str.maketrans({"“": '"', "”": '"'})
+
+
+class ItineraryParseError(ValueError):
+    pass
+
+
+class ItineraryStreamParser:
+    """
+    Parse the itinerary object chunk by chunk.
+
+    feed() returns the events completed by that chunk:
+        ("general", value), ("hotel", value), ("flight", value)
+        ("plan", "day1", activities), ...
+    Once the root object has closed, `result` holds the parsed dict.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.result = None
+        self._pos = 0
+        self._root_start = None
+        self._done = False
+        self._in_string = False
+        self._escape = False
+        self._string_start = None
+        # Frames: {"type": "obj"|"arr", "path": tuple, "key": str, "value_start": int, "expect_key": bool}
+        self._stack = []
+
+    def feed(self, chunk):
+        self.text += chunk
+        events = []
+        text = self.text
+        while self._pos < len(text) and not self._done:
+            i = self._pos
+            c = text[i]
+            self._pos += 1
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+                    frame = self._stack[-1]
+                    if frame["type"] == "obj" and frame["expect_key"]:
+                        frame["key"] = json.loads(text[self._string_start:i + 1])
+                continue
+
+            if self._root_start is None:
+                if c == "{":
+                    following = text[i + 1:].lstrip()
+                    if not following:
+                        # Wait for the next chunk to tell JSON from a brace in prose
+                        self._pos = i
+                        break
+                    if following[0] in '"}':
+                        self._root_start = i
+                        self._stack.append(self._frame("obj", ()))
+                continue
+
+            frame = self._stack[-1]
+            if c == '"':
+                self._in_string = True
+                self._string_start = i
+                self._begin_value(frame, i)
+            elif c in "{[":
+                self._begin_value(frame, i)
+                path = frame["path"] + ((frame["key"],) if frame["type"] == "obj" else ())
+                self._stack.append(self._frame("obj" if c == "{" else "arr", path))
+            elif c == ":" and frame["type"] == "obj":
+                frame["expect_key"] = False
+            elif c == "," or c in "}]":
+                if frame["type"] == "obj" and frame["value_start"] is not None:
+                    events.extend(self._complete(frame, i))
+                if c == ",":
+                    frame["expect_key"] = frame["type"] == "obj"
+                    frame["value_start"] = None
+                    continue
+                self._stack.pop()
+                if not self._stack:
+                    self._done = True
+                    self.result = _loads(text[self._root_start:i + 1])
+            elif not c.isspace():
+                self._begin_value(frame, i)
+        return events
+
+    @staticmethod
+    def _frame(kind, path):
+        return {"type": kind, "path": path, "key": None, "value_start": None, "expect_key": kind == "obj"}
+
+    @staticmethod
+    def _begin_value(frame, i):
+        if frame["type"] == "obj" and not frame["expect_key"] and frame["value_start"] is None:
+            frame["value_start"] = i
+
+    def _complete(self, frame, end):
+        raw = self.text[frame["value_start"]:end]
+        try:
+            value = json.loads(raw)
+        except ValueError:
+            return []
+        if frame["path"] == () and frame["key"] in SECTIONS:
+            return [(frame["key"], value)]
+        if frame["path"] == ("plan",):
+            return [("plan", frame["key"], value)]
+        return []
+
+
+def _loads(text):
+    try:
+        return json.loads(text)
+    except ValueError:
+        return None
+
+
+def _top_level_starts(text, pos=0):
+    # Braces that open an object outside any earlier candidate; a nested
+    # {"name": ...} of a cut-off itinerary is not the itinerary
+    starts, depth, in_string, escape = [], 0, False, False
+    for i in range(pos, len(text)):
+        c = text[i]
+        if in_string:
+            if escape:
+                escape = False
+            elif c == "\\":
+                escape = True
+            elif c == '"':
+                in_string = False
+        elif depth == 0:
+            if c == "{" and _OBJECT_START.match(text, i):
+                starts.append(i)
+                depth = 1
+        elif c == '"':
+            in_string = True
+        elif c in "{[":
+            depth += 1
+        elif c in "}]":
+            depth -= 1
+    return starts
+
+
+def _object_starts(text):
+    """Where the itinerary object may start: inside a ```json fence first, then anywhere."""
+    fence = _FENCE.search(text)
+    starts = _top_level_starts(text, fence.end()) if fence else []
+    return starts + [i for i in _top_level_starts(text) if i not in starts]
+
+
+def repair_json(text, start=None):
+    """One cheap, local repair pass for almost-valid model output."""
+    text = text.translate(_SMART_QUOTES)
+    if start is None:
+        starts = _object_starts(text)
+        if not starts:
+            raise ItineraryParseError("No JSON object found in model output")
+        start = starts[0]
+    text = _FENCE.sub("", text[start:])
+
+    # Close unterminated strings/containers and drop anything after the root object.
+    # frames hold [closer, expecting_key]; key_start is the quote of an object key
+    # whose value is not complete yet, so a cut-off "key" or "key": can be dropped.
+    frames, in_string, escape, end, key_start, escape_start = [], False, False, len(text), None, None
+    for i, c in enumerate(text):
+        if in_string:
+            if escape:
+                escape = False
+            elif c == "\\":
+                escape, escape_start = True, i
+            elif c == '"':
+                in_string = False
+        elif c == '"':
+            in_string = True
+            if frames and frames[-1][1]:
+                key_start = i
+            elif frames and frames[-1][0] == "}":
+                key_start = None
+        elif c == ":" and frames:
+            frames[-1][1] = False
+        elif c in "{[":
+            key_start = None
+            frames.append(["}" if c == "{" else "]", c == "{"])
+        elif c == "," and frames:
+            key_start = None
+            frames[-1][1] = frames[-1][0] == "}"
+        elif c in "}]" and frames:
+            key_start = None
+            frames.pop()
+            if not frames:
+                end = i + 1
+                break
+    text = text[:end]
+    if frames:
+        if key_start is not None:
+            text, in_string = text[:key_start], False
+        elif in_string and escape_start is not None and (escape or (
+                text[escape_start + 1] == "u" and len(text) - escape_start < 6)):
+            text = text[:escape_start]  # cut inside \n or \u00e9
+        text = text.rstrip().rstrip(",") + ('"' if in_string else "") + "".join(f[0] for f in reversed(frames))
+    return _TRAILING_COMMA.sub(r"\1", text)
+
+
+def _is_itinerary(data):
+    return isinstance(data, dict) and any(k in data for k in SECTIONS + ("plan",))
+
+
+@timed("parse_itinerary")
+def parse_itinerary(text):
+    """Parse the itinerary object out of the final model message."""
+    parser = ItineraryStreamParser()
+    parser.feed(text)
+    if _is_itinerary(parser.result):
+        return normalize_itinerary(parser.result)
+    starts = _object_starts(text.translate(_SMART_QUOTES))
+    if not starts:
+        raise ItineraryParseError("No JSON object found in model output")
+    error = None
+    # If the first candidate does not parse, it was not the itinerary; try the next one
+    for start in starts:
+        try:
+            data = json.loads(repair_json(text, start))
+            if not _is_itinerary(data):
+                raise ItineraryParseError("JSON object has none of the itinerary sections")
+            return normalize_itinerary(data)
+        except ValueError as e:
+            error = error or e
+    raise ItineraryParseError(f"Could not parse itinerary JSON: {error}") from error
+
+
+def normalize_itinerary(data):
+    """Coerce harmless shape variations (plan as a dict) into the expected layout."""
+    if not isinstance(data, dict):
+        raise ItineraryParseError("Itinerary must be a JSON object")
+    if isinstance(data.get("plan"), dict):
+        data["plan"] = [data["plan"]]
+    return data
+
+
+# Field schema matching OUTPUT_EXAMPLE in prompts.py
+HOTEL_FIELDS = ("name", "price_per_night", "rating")
+FLIGHT_FIELDS = ("airline", "departure_time", "arrival_time", "departure_airport", "arrival_airport", "price")
+ACTIVITY_FIELDS = ("time", "type", "description")
+
+
+def validate_itinerary(data):
+    """Return a list of schema problems (empty if the itinerary is well-formed)."""
+    problems = []
+    if not isinstance(data.get("general"), str):
+        problems.append("general: expected a string")
+
+    hotel = data.get("hotel")
+    if not isinstance(hotel, dict):
+        problems.append("hotel: expected an object")
+    else:
+        problems += [f"hotel.{k}: missing" for k in HOTEL_FIELDS if hotel.get(k) in (None, "")]
+
+    flight = data.get("flight")
+    if not isinstance(flight, dict):
+        problems.append("flight: expected an object")
+    else:
+        for leg in ("outbound", "return"):
+            segment = flight.get(leg)
+            if not isinstance(segment, dict):
+                problems.append(f"flight.{leg}: expected an object")
+                continue
+            problems += [f"flight.{leg}.{k}: missing" for k in FLIGHT_FIELDS if k not in segment]
+
+    legs = data.get("legs")
+    if legs is not None:
+        if not isinstance(legs, list):
+            problems.append("legs: expected a list")
+        else:
+            for n, leg in enumerate(legs):
+                if not isinstance(leg, dict) or not isinstance(leg.get("hotel"), dict):
+                    problems.append(f"legs[{n}]: expected destination, hotel and flight")
+                    continue
+                problems += [f"legs[{n}].hotel.{k}: missing" for k in HOTEL_FIELDS if leg["hotel"].get(k) in (None, "")]
+
+    plan = data.get("plan")
+    if not isinstance(plan, list):
+        problems.append("plan: expected a list")
+    else:
+        for day_dict in plan:
+            if not isinstance(day_dict, dict):
+                problems.append("plan: expected objects of day -> activities")
+                continue
+            for day, activities in day_dict.items():
+                if not isinstance(activities, list):
+                    problems.append(f"plan.{day}: expected a list")
+                    continue
+                for n, item in enumerate(activities):
+                    if not isinstance(item, dict) or any(k not in item for k in ACTIVITY_FIELDS):
+                        problems.append(f"plan.{day}[{n}]: expected time, type and description")
+    return problems
@@ -0,0 +1,137 @@
+"""
+Multi-city trips.
+
+A trip with legs (see trip_context.Leg) is searched per leg: the hotel for
+the stay and a one-way flight from the previous city (the origin for the
+first leg), plus the flight home after the last leg. The graph fans the legs
+out in parallel (Agent.fan_out_legs -> search_leg) and merges them in leg
+order; check_legs() then compares the picked flights and hotels across legs
+so the itinerary can account for late arrivals, early landings and airport
+changes.
+"""
+import datetime
+import re
+from dataclasses import replace
+
+from flight_tool import FlightResult
+from hotel_tool import HotelResult
+from package_optimizer import arrival_gap
+from trip_context import fill_tool_args
+
+# Landing this many hours before check-in opens gets a note
+EARLY_ARRIVAL_HOURS = 4
+
+_STOP = re.compile(r"^\s*(.+?)\s*[,;]\s*(\d{4}-\d{2}-\d{2})\s*[,;]\s*(\d{4}-\d{2}-\d{2})\s*$")
+
+
+def parse_stops(text):
+    """
+    Legs from free text, one stay per line: "City, YYYY-MM-DD, YYYY-MM-DD".
+    Raises ValueError naming the first line that does not match.
+    """
+    legs = []
+    for line in (text or "").splitlines():
+        if not line.strip():
+            continue
+        match = _STOP.match(line)
+        if match is None:
+            raise ValueError(f"expected 'City, YYYY-MM-DD, YYYY-MM-DD', got '{line.strip()}'")
+        destination, start_date, end_date = match.groups()
+        legs.append({"destination": destination, "start_date": start_date, "end_date": end_date})
+    return legs
+
+
+def leg_context(ctx, index):
+    """A single-city TripContext for one leg, flying in from the previous city."""
+    leg = ctx.legs[index]
+    origin = ctx.origin if index == 0 else ctx.legs[index - 1].destination
+    return replace(ctx, origin=origin, destination=leg.destination,
+                   start_date=leg.start_date, end_date=leg.end_date, flex_days=0, legs=())
+
+
+def leg_tool_calls(ctx, index, run_id):
+    """The hotel and one-way flight searches of one leg (and the flight home after the last)."""
+    leg_ctx = leg_context(ctx, index)
+    calls = [{
+        "name": "hotels_finder",
+        "args": {"params": fill_tool_args("hotels_finder", {}, leg_ctx)},
+        "id": f"leg{index}_hotels_{run_id}",
+    }]
+    if leg_ctx.origin:
+        calls.append({
+            "name": "flights_finder",
+            "args": {"params": fill_tool_args("flights_finder", {"return_date": None}, leg_ctx)},
+            "id": f"leg{index}_flights_{run_id}",
+        })
+    if index == len(ctx.legs) - 1 and ctx.origin:
+        home = {"departure_airport": leg_ctx.destination, "arrival_airport": ctx.origin,
+                "outbound_date": leg_ctx.end_date, "return_date": None}
+        calls.append({
+            "name": "flights_finder",
+            "args": {"params": fill_tool_args("flights_finder", home, leg_ctx)},
+            "id": f"leg{index}_home_{run_id}",
+        })
+    return calls
+
+
+def _date(value):
+    # SerpAPI times look like "2025-07-01 14:30"
+    try:
+        return datetime.date.fromisoformat(str(value)[:10])
+    except ValueError:
+        return None
+
+
+def _as(cls, data):
+    if not isinstance(data, dict):
+        return None
+    try:
+        return cls(**data)
+    except TypeError:
+        return None
+
+
+def check_legs(ctx, picks):
+    """
+    Consistency notes for the picked hotel and flights of every leg.
+
+    picks holds one dict per leg, in order, with the first "hotel" and
+    "flight" result (dicts, or None if the search found nothing) and, for
+    the last leg, the "home" flight.
+    """
+    notes = []
+    previous_flight = None
+    for index, (leg, pick) in enumerate(zip(ctx.legs, picks)):
+        hotel, flight = _as(HotelResult, pick.get("hotel")), _as(FlightResult, pick.get("flight"))
+        if hotel is None:
+            notes.append(f"{leg.destination}: no hotel found for {leg.start_date} to {leg.end_date}")
+        if flight is None and (index or ctx.origin):
+            notes.append(f"{leg.destination}: no flight found for {leg.start_date}")
+
+        if index and ctx.legs[index - 1].end_date < leg.start_date:
+            notes.append(f"{leg.destination}: no accommodation booked between "
+                         f"{ctx.legs[index - 1].end_date} and {leg.start_date}")
+
+        if flight is not None:
+            departed, landed = _date(flight.departure_time), _date(flight.arrival_time)
+            # Between stays the flight should leave on the previous check-out day
+            checked_out = ctx.legs[index - 1].end_date if index else None
+            if checked_out and departed and str(departed) != checked_out:
+                notes.append(f"{leg.destination}: flight departs on {departed}, not on the {checked_out} check-out")
+            if landed and landed > datetime.date.fromisoformat(leg.start_date):
+                notes.append(f"{leg.destination}: flight lands on {landed}, after the {leg.start_date} check-in; "
+                             "the first night is unused")
+            gap = arrival_gap(hotel, flight)
+            if gap is not None and gap >= EARLY_ARRIVAL_HOURS:
+                notes.append(f"{leg.destination}: lands at {flight.arrival_time[-5:]}, {gap:.0f}h before check-in "
+                             f"({hotel.check_in_time}); plan luggage storage")
+            if previous_flight is not None and previous_flight.arrival_airport and flight.departure_airport \
+                    and previous_flight.arrival_airport != flight.departure_airport:
+                notes.append(f"{leg.destination}: departs from {flight.departure_airport} but the previous flight "
+                             f"landed at {previous_flight.arrival_airport}; allow time for the transfer")
+            previous_flight = flight
+
+    home = _as(FlightResult, picks[-1].get("home")) if picks else None
+    if home is not None and _date(home.departure_time) not in (None, datetime.date.fromisoformat(ctx.end_date)):
+        notes.append(f"Flight home departs on {_date(home.departure_time)}, not on the {ctx.end_date} check-out")
+    return notes
@@ -0,0 +1,177 @@
+"""
+Deterministic flight + hotel package selection.
+
+Every hotel is paired with every flight and the packages are compared on
+total cost, hotel rating and class, stops, flight duration, and the wait
+between landing and hotel check-in. Packages on the Pareto frontier rank
+first, ordered by a weighted score that depends on the budget tier; the
+LLM only sees the winners and writes the itinerary around them.
+Identical inputs always give the same ranking.
+"""
+import datetime
+import os
+from dataclasses import dataclass
+from typing import Optional
+
+from flight_tool import FlightResult
+from hotel_tool import HotelResult
+from prices import parse_price
+from trip_context import HOTEL_CLASS_BY_BUDGET
+
+# Constants
+PACKAGE_TOP_K = int(os.getenv("PACKAGE_TOP_K", "3"))
+
+# Criterion weights per budget tier; every criterion is normalized to 0..1 first
+WEIGHTS_BY_BUDGET = {
+    "low": {"cost": 0.55, "rating": 0.15, "hotel_class": 0.05, "stops": 0.1, "duration": 0.1, "arrival_gap": 0.05},
+    "medium": {"cost": 0.35, "rating": 0.2, "hotel_class": 0.1, "stops": 0.15, "duration": 0.1, "arrival_gap": 0.1},
+    "high": {"cost": 0.1, "rating": 0.3, "hotel_class": 0.2, "stops": 0.2, "duration": 0.1, "arrival_gap": 0.1},
+}
+# Criteria where a larger value is better
+MAXIMIZE = {"rating", "hotel_class"}
+
+
+@dataclass
+class Package:
+    hotel: Optional[HotelResult]
+    flight: Optional[FlightResult]
+    criteria: dict
+    score: float = 0.0
+    pareto: bool = False
+
+    @property
+    def cost(self):
+        return self.criteria["cost"]
+
+
+def _nights(ctx):
+    try:
+        start = datetime.date.fromisoformat(ctx.start_date)
+        end = datetime.date.fromisoformat(ctx.end_date)
+    except (TypeError, ValueError):
+        return None
+    return max((end - start).days, 1)
+
+
+def _hotel_cost(hotel, nights):
+    total = parse_price(hotel.total_price)
+    if total is not None:
+        return total
+    per_night = parse_price(hotel.price_per_night)
+    return per_night * nights if per_night is not None and nights else None
+
+
+def arrival_gap(hotel, flight):
+    """Hours between landing and the hotel's check-in time (0 if check-in is already open)."""
+    if hotel is None or flight is None or not hotel.check_in_time or not flight.arrival_time:
+        return None
+    try:
+        landed = datetime.datetime.strptime(flight.arrival_time, "%Y-%m-%d %H:%M")
+        check_in = datetime.datetime.strptime(hotel.check_in_time.strip().upper(), "%I:%M %p").time()
+    except ValueError:
+        return None
+    opens = datetime.datetime.combine(landed.date(), check_in)
+    return max((opens - landed).total_seconds() / 3600, 0.0)
+
+
+def _criteria(hotel, flight, nights):
+    hotel_cost = _hotel_cost(hotel, nights) if hotel else 0.0
+    flight_cost = parse_price(flight.price) if flight else 0.0
+    return {
+        "cost": None if hotel_cost is None or flight_cost is None else hotel_cost + flight_cost,
+        "rating": hotel.rating if hotel else None,
+        "hotel_class": hotel.hotel_class if hotel else None,
+        "stops": flight.stops if flight else None,
+        "duration": flight.duration if flight else None,
+        "arrival_gap": arrival_gap(hotel, flight),
+    }
+
+
+def _badness(packages):
+    """
+    Per package, each criterion mapped to 0 (best seen) .. 1 (worst seen).
+    Missing values count as the worst.
+    """
+    rows = [{} for _ in packages]
+    for name in packages[0].criteria:
+        values = [p.criteria[name] for p in packages if p.criteria[name] is not None]
+        low, high = (min(values), max(values)) if values else (0, 0)
+        for row, p in zip(rows, packages):
+            value = p.criteria[name]
+            if value is None:
+                row[name] = 1.0 if values else 0.0
+            elif high == low:
+                row[name] = 0.0
+            elif name in MAXIMIZE:
+                row[name] = (high - value) / (high - low)
+            else:
+                row[name] = (value - low) / (high - low)
+    return rows
+
+
+def _dominates(a, b):
+    return all(x <= y for x, y in zip(a, b)) and any(x < y for x, y in zip(a, b))
+
+
+def _pareto_flags(vectors):
+    """
+    Whether each vector is non-dominated (sort-filter skyline). A dominating
+    vector always has a smaller sum, so after sorting by sum each vector only
+    needs comparing with the frontier found so far: O(n * frontier) instead
+    of O(n^2).
+    """
+    flags = [False] * len(vectors)
+    frontier = []
+    for i in sorted(range(len(vectors)), key=lambda i: sum(vectors[i])):
+        if not any(_dominates(frontier_vector, vectors[i]) for frontier_vector in frontier):
+            flags[i] = True
+            frontier.append(vectors[i])
+    return flags
+
+
+def _tie_break(package):
+    return (
+        package.hotel.name if package.hotel else "",
+        package.flight.airline if package.flight else "",
+        package.flight.departure_time or "" if package.flight else "",
+    )
+
+
+def _in_budget_tier(hotels, budget):
+    allowed = HOTEL_CLASS_BY_BUDGET.get(budget)
+    if not allowed:
+        return hotels
+    classes = {int(c) for c in allowed.split(",")}
+    in_tier = [h for h in hotels if h.hotel_class in classes]
+    # The search may have been run without a class filter; never drop everything
+    return in_tier or hotels
+
+
+def rank_packages(hotels, flights, ctx):
+    """All hotel x flight packages, Pareto-optimal first, then by descending score."""
+    budget = (ctx.budget or "Medium").lower()
+    weights = WEIGHTS_BY_BUDGET.get(budget, WEIGHTS_BY_BUDGET["medium"])
+    nights = _nights(ctx)
+
+    hotel_options = _in_budget_tier(list(hotels or []), budget) or [None]
+    flight_options = list(flights or []) or [None]
+    packages = [Package(h, f, _criteria(h, f, nights))
+                for h in hotel_options for f in flight_options if h or f]
+    if not packages:
+        return []
+
+    badness = _badness(packages)
+    vectors = [tuple(row.values()) for row in badness]
+    for package, row, pareto in zip(packages, badness, _pareto_flags(vectors)):
+        package.score = round(1 - sum(weights[name] * value for name, value in row.items()), 6)
+        package.pareto = pareto
+
+    return sorted(packages, key=lambda p: (not p.pareto, -p.score, p.cost if p.cost is not None else float("inf"), _tie_break(p)))
+
+
+def winners(hotels, flights, ctx, k=PACKAGE_TOP_K):
+    """The hotels and flights of the top-k packages, best first and without duplicates."""
+    top = rank_packages(hotels, flights, ctx)[:k]
+    top_hotels = list({id(p.hotel): p.hotel for p in top if p.hotel}.values())
+    top_flights = list({id(p.flight): p.flight for p in top if p.flight}.values())
+    return top_hotels, top_flights
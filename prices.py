@@ -0,0 +1,11 @@
+import re
+
+_AMOUNT = re.compile(r"-?\d[\d,]*(?:\.\d+)?")
+
+
+def parse_price(value):
+    """Numeric amount of a price like "$1,234" or 1234 (None if there is none)."""
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = _AMOUNT.search(str(value or ""))
+    return float(match.group().replace(",", "")) if match else None
@@ -0,0 +1,140 @@
+"""
+System prompts for the agent, assembled from versioned sections.
+
+Each LLM call only needs part of the instructions:
+- "tools": no search results yet, so the model has to pick the hotel and
+  flight searches (tool usage rules and example calls)
+- "itinerary": results are in the conversation, so the model writes the
+  final JSON (itinerary rules and the output format)
+- "multi_city": the itinerary phase of a trip with several stays
+Compiled prompts are cached per (phase, year). Bump a section's version
+whenever its text changes; prompt_version() changes with it, so logs and
+benchmarks can tell prompt revisions apart.
+
+    python prompts.py
+
+prints the estimated tokens of every section per phase.
+"""
+import hashlib
+import json
+from collections import namedtuple
+from functools import lru_cache
+
+from token_count import estimate_tokens
+
+TOOLS_PHASE = "tools"
+ITINERARY_PHASE = "itinerary"
+MULTI_CITY_PHASE = "multi_city"
+PHASES = (TOOLS_PHASE, ITINERARY_PHASE, MULTI_CITY_PHASE)
+WRITING_PHASES = (ITINERARY_PHASE, MULTI_CITY_PHASE)
+
+# text is a format string; {year} is the only placeholder
+Section = namedtuple("Section", "name version phases text")
+
+OUTPUT_EXAMPLE = {
+    "general": "general information about the vacation",
+    "hotel": {"name": "Tokyo Stay", "price_per_night": "$150", "rating": 4.5},
+    "flight": {
+        "outbound": {
+            "airline": "Air France", "departure_time": "10:15", "arrival_time": "14:30",
+            "departure_airport": "JFK", "arrival_airport": "CDG", "price": "$600",
+            "link": "https://booking.airfrance.com",
+        },
+        "return": {
+            "airline": "Air France", "departure_time": "12:00", "arrival_time": "15:45",
+            "departure_airport": "CDG", "arrival_airport": "JFK", "price": "$580",
+            "link": "https://booking.airfrance.com",
+        },
+    },
+    "plan": [{
+        "day1": [
+            {"time": "10:00", "type": "Visit", "description": "Tokyo National Museum"},
+            {"time": "13:00", "type": "Lunch", "description": "Sushi Dai"},
+            {"time": "15:00", "type": "Explore", "description": "Akihabara"},
+        ],
+    }],
+}
+
+SECTIONS = (
+    Section("role", 1, PHASES, """You are a smart travel agency. Use the tools to look up information.
+The current year is {year}."""),
+
+    Section("tool_usage", 1, (TOOLS_PHASE,), """You are allowed to make multiple calls (either together or in sequence).
+Only look up information when you are sure of what you want.
+When booking flights, automatically determine the closest major airport to a given city (e.g., Paris → CDG, Madrid → MAD). Do not ask the user for airport codes; make a reasonable assumption based on well-known airport locations.
+Search flights for both the outbound (origin to destination) and return (destination to origin) segments."""),
+
+    Section("hotel_class", 1, (TOOLS_PHASE,), """Use the following logic for hotel_class selection based on budget:
+- Low budget: hotel_class = "1,2"
+- Medium budget: hotel_class = "3,4"
+- High budget: hotel_class = "5\""""),
+
+    Section("tool_examples", 1, (TOOLS_PHASE,), """Example Tool Calls:
+hotels_finder({{"q": "Paris", "check_in_date": "{year}-07-01", "check_out_date": "{year}-07-05", "adults": 2, "children": 1, "rooms": 1, "hotel_class": "3,4", "sort_by": 8}})
+flights_finder({{"departure_airport": "JFK", "arrival_airport": "CDG", "outbound_date": "{year}-07-01", "return_date": "{year}-07-05", "adults": 2, "children": 0}})"""),
+
+    Section("results", 1, WRITING_PHASES, """If hotel and flight results for the trip are already in the conversation, do not search again; use them to write the itinerary.
+Hotel and flight results are already ranked best first for the traveller's budget: use the first hotel and the first flight."""),
+
+    Section("itinerary_rules", 1, WRITING_PHASES, """In your json output always include:
+- name and rating of the hotel
+- price per night and total cost (with currency symbol, e.g., €84 per night, €337 total)
+- and a link if possible
+- for flights: airline name, price, departure and arrival airports, departure and arrival times, and a booking link
+Please include complete flight information — both outbound (origin to destination) and return (destination to origin) segments.
+
+Use 24-hour format (e.g., 14:00) for all times.
+Adjust the travel itinerary to start only after the flight's landing time, and begin near the arrival airport.
+Always plan to arrive at the airport **at least 3 hours before any international flight departure**. Adjust the itinerary accordingly to allow for enough travel and check-in time."""),
+
+    Section("style", 1, WRITING_PHASES, """Always generate a rich, full itinerary that includes specific recommended places to visit, eat and enjoy.
+Use famous, popular, or hidden gem recommendations in the area of the hotel or arrival airport.
+Do not be vague. For example, instead of:
+"Visit a Parisian landmark" → say "Visit the Eiffel Tower"
+"Explore nightlife" → say "Have a drink at Little Red Door, one of Paris’ top speakeasies"
+Your output must feel like a personal guide built by a local expert, not a generic outline."""),
+
+    Section("multi_city", 1, (MULTI_CITY_PHASE,), """This trip visits several cities. Each stay has its own hotel search and a one-way flight from the previous city; the last stay also has the flight home. Use the first hotel and first flight of every stay.
+The tool-call turn may list checks across legs (late landings, early arrivals before check-in, airport changes): plan around them.
+Number the days continuously across the whole trip and plan each day in the city the traveller is in that day; travel days end in the next city.
+Besides the fields below, add "legs": one object per stay, in order, with "destination", "hotel" (same fields as "hotel") and "flight" (same fields as an outbound flight). Set "hotel" to the first stay's hotel, "flight.outbound" to the first flight and "flight.return" to the flight home."""),
+
+    Section("output_format", 1, WRITING_PHASES, """IMPORTANT: You must return **only valid JSON** in your response. Do not include any text, titles, explanations, or markdown. The entire response must be a single JSON object in the format below, with one "dayN" key per day of the trip. If a value is missing, use null or an empty string, but keep the JSON structure intact.
+""" + json.dumps(OUTPUT_EXAMPLE, ensure_ascii=False).replace("{", "{{").replace("}", "}}")),
+)
+
+
+def sections(phase):
+    if phase not in PHASES:
+        raise ValueError(f"Unknown prompt phase: {phase}")
+    return [s for s in SECTIONS if phase in s.phases]
+
+
+@lru_cache(maxsize=None)
+def system_prompt(phase, year):
+    """The compiled system prompt for a graph phase."""
+    return "\n\n".join(s.text.format(year=year) for s in sections(phase))
+
+
+@lru_cache(maxsize=None)
+def prompt_version(phase):
+    """Short id of the section versions a phase is built from."""
+    ids = ",".join(f"{s.name}@{s.version}" for s in sections(phase))
+    return hashlib.sha256(ids.encode("utf-8")).hexdigest()[:8]
+
+
+def token_report(phase, year):
+    """[(section, version, estimated tokens)] for a compiled phase prompt."""
+    return [(s.name, s.version, estimate_tokens(s.text.format(year=year))) for s in sections(phase)]
+
+
+if __name__ == "__main__":
+    import datetime
+
+    current_year = datetime.date.today().year
+    for prompt_phase in PHASES:
+        report = token_report(prompt_phase, current_year)
+        print(f"{prompt_phase} ({prompt_version(prompt_phase)})")
+        for name, version, tokens in report:
+            print(f"  {name:<16} v{version:<3} {tokens:>6}")
+        print(f"  {'total':<20} {estimate_tokens(system_prompt(prompt_phase, current_year)):>6}")
@@ -0,0 +1,193 @@
+"""
+HTML rendering of the results page.
+
+Templates are compiled once at import (string.Template) and every value is
+HTML-escaped, so model output cannot inject markup and missing fields fall
+back to "N/A" instead of raising. render_results() produces the whole view
+(styles, summary, hotel and flight cards, every day) as one string, so
+Streamlit sends it in a single st.markdown call; the output is memoized by
+the itinerary's content hash.
+"""
+import hashlib
+import html
+import json
+import threading
+from collections import OrderedDict
+from string import Template
+from urllib.parse import quote_plus
+
+# Constants
+RENDER_CACHE_ENTRIES = 128
+
+ACTIVITY_ICONS = {
+    "visit": "🏛️",
+    "explore": "🧭",
+    "lunch": "🍽️",
+    "dinner": "🍷",
+    "check-in": "🏨",
+    "check-out": "🧳",
+    "arrival": "🛬",
+    "departure": "🛫",
+    "transfer": "🚗",
+    "nightlife": "🍸",
+    "shopping": "🛍️",
+    "breakfast": "🥐"
+}
+
+STYLES = """
+<style>
+.tg-summary { background-color: rgba(255, 255, 255, 0.60); padding: 2rem; border-radius: 12px;
+  box-shadow: 0 4px 12px rgba(0, 0, 0, 0.15); text-align: center; margin: 1.5rem 0; }
+.tg-summary h3 { margin: 0; }
+.tg-cards { display: grid; grid-template-columns: repeat(auto-fit, minmax(240px, 1fr)); gap: 1.5rem; margin-bottom: 1.5rem; }
+.tg-card { background-color: rgba(255, 255, 255, 0.85); padding: 1.5rem; border-radius: 12px; min-height: 230px;
+  box-shadow: 0 4px 12px rgba(0,0,0,0.1); text-align: center; display: flex; flex-direction: column;
+  justify-content: space-between; }
+.tg-day { background-color: rgba(255, 255, 255, 0.80); font-weight: bold; text-align: center;
+  border-radius: 8px; padding: 1em; margin-bottom: 1.5em; }
+</style>
+"""
+
+SUMMARY = Template("""<div class="tg-summary"><h3>$general</h3></div>""")
+
+HOTEL_CARD = Template("""<div class="tg-card"><div><h4>$title</h4>
+<p><strong>$name</strong><br>$price_per_night per night<br>⭐ $rating</p></div>
+<a href="$link" target="_blank" rel="noopener">Hotel Website</a></div>""")
+
+FLIGHT_CARD = Template("""<div class="tg-card"><div><h4>$title</h4>
+<p><strong>$airline</strong><br>$departure_time → $arrival_time<br>$departure_airport → $arrival_airport<br>💰 $price</p></div>
+$link</div>""")
+
+DAY = Template("""<div class="tg-day"><div class="day-header">📅 $label</div>$activities</div>""")
+
+ACTIVITY = Template("""<p class="activity"><strong>$time</strong> — $icon <strong>$type</strong>: $description</p>""")
+
+TOOL_PREVIEW = Template("""<div class="tg-card" style="min-height: 0; margin-bottom: 1rem;"><h4>$title</h4><p>$lines</p></div>""")
+
+RESULTS = Template("""$styles$summary<div class="tg-cards">$cards</div>
+<h3 style="text-align: center;">🗓️ Itinerary</h3>$days""")
+
+
+def _text(value, default="N/A"):
+    if value is None or value == "":
+        value = default
+    return html.escape(str(value))
+
+
+def _url(value):
+    """Escaped http(s) URL, or None for anything else (e.g. javascript:)."""
+    if isinstance(value, str) and value.strip().lower().startswith(("http://", "https://")):
+        return html.escape(value.strip(), quote=True)
+    return None
+
+
+def _field(data, key):
+    return _text(data.get(key) if isinstance(data, dict) else None)
+
+
+def render_hotel(hotel, title="🏨 Hotel"):
+    hotel = hotel if isinstance(hotel, dict) else {}
+    link = _url(hotel.get("link"))
+    if link is None and hotel.get("name"):
+        link = html.escape(f"https://www.google.com/search?q={quote_plus(str(hotel['name']))}+booking", quote=True)
+    return HOTEL_CARD.substitute(
+        title=_text(title), name=_field(hotel, "name"), price_per_night=_field(hotel, "price_per_night"),
+        rating=_field(hotel, "rating"), link=link or "#",
+    )
+
+
+def render_flight(title, leg):
+    link = _url(leg.get("link"))
+    return FLIGHT_CARD.substitute(
+        title=title,
+        airline=_field(leg, "airline"),
+        departure_time=_field(leg, "departure_time"), arrival_time=_field(leg, "arrival_time"),
+        departure_airport=_field(leg, "departure_airport"), arrival_airport=_field(leg, "arrival_airport"),
+        price=_field(leg, "price"),
+        link=f'<a href="{link}" target="_blank" rel="noopener">Book flight</a>' if link else "",
+    )
+
+
+def render_day(raw_day, activities):
+    label = str(raw_day).replace("day", "Day ").capitalize()
+    items = []
+    for item in activities if isinstance(activities, list) else []:
+        if not isinstance(item, dict):
+            continue
+        kind = str(item.get("type") or "")
+        items.append(ACTIVITY.substitute(
+            time=_field(item, "time"), icon=ACTIVITY_ICONS.get(kind.lower(), "📍"),
+            type=_text(kind), description=_field(item, "description"),
+        ))
+    return DAY.substitute(label=_text(label), activities="".join(items))
+
+
+def render_tool_preview(name, options):
+    """Card for the first few results of a hotel or flight search (streaming view)."""
+    if not isinstance(options, list):
+        return ""
+    options = [o for o in options[:3] if isinstance(o, dict)]
+    if name == "hotels_finder":
+        title = "🏨 Hotel options"
+        lines = [f"<strong>{_field(o, 'name')}</strong> — {_field(o, 'price_per_night')} per night ⭐ {_field(o, 'rating')}"
+                 for o in options]
+    else:
+        title = "✈️ Flight options"
+        lines = [f"<strong>{_field(o, 'airline')}</strong> {_field(o, 'departure_airport')} → "
+                 f"{_field(o, 'arrival_airport')} — 💰 {_field(o, 'price')}" for o in options]
+    return TOOL_PREVIEW.substitute(title=title, lines="<br>".join(lines))
+
+
+def _render(itinerary):
+    flight = itinerary.get("flight") if isinstance(itinerary.get("flight"), dict) else {}
+    legs = [leg for leg in itinerary.get("legs") or [] if isinstance(leg, dict)]
+    if legs:
+        # Multi-city: a flight and a hotel per stay, then the flight home
+        cards = []
+        for leg in legs:
+            destination = leg.get("destination") or ""
+            if isinstance(leg.get("flight"), dict):
+                cards.append(render_flight(_text(f"✈️ To {destination}"), leg["flight"]))
+            cards.append(render_hotel(leg.get("hotel"), f"🏨 {destination}"))
+        if isinstance(flight.get("return"), dict):
+            cards.append(render_flight("🔁 Flight Home", flight["return"]))
+    else:
+        cards = [render_hotel(itinerary.get("hotel"))]
+        for key, title in (("outbound", "✈️ Outbound Flight"), ("return", "🔁 Return Flight")):
+            if isinstance(flight.get(key), dict):
+                cards.append(render_flight(title, flight[key]))
+
+    days = []
+    plan = itinerary.get("plan")
+    for day_dict in plan if isinstance(plan, list) else []:
+        if isinstance(day_dict, dict):
+            days.extend(render_day(raw_day, activities) for raw_day, activities in day_dict.items())
+
+    return RESULTS.substitute(
+        styles=STYLES, summary=SUMMARY.substitute(general=_field(itinerary, "general")),
+        cards="".join(cards), days="".join(days),
+    )
+
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def itinerary_hash(itinerary):
+    payload = json.dumps(itinerary, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def render_results(itinerary):
+    """The whole results view for a parsed itinerary, as one HTML string."""
+    key = itinerary_hash(itinerary)
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+    rendered = _render(itinerary)
+    with _cache_lock:
+        _cache[key] = rendered
+        while len(_cache) > RENDER_CACHE_ENTRIES:
+            _cache.popitem(last=False)
+    return rendered
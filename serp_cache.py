@@ -0,0 +1,196 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import serp_client
+from instrumentation import METRICS, span
+from singleflight import SingleFlight
+
+# Constants
+CACHE_PATH = os.getenv("SERPAPI_CACHE_PATH", ".cache/serpapi.sqlite3")
+HOTELS_TTL = int(os.getenv("SERPAPI_CACHE_HOTELS_TTL", str(6 * 3600)))
+FLIGHTS_TTL = int(os.getenv("SERPAPI_CACHE_FLIGHTS_TTL", str(1 * 3600)))
+MEMORY_MAX_ENTRIES = int(os.getenv("SERPAPI_CACHE_MEMORY_ENTRIES", "256"))
+DISK_MAX_BYTES = int(os.getenv("SERPAPI_CACHE_DISK_BYTES", str(200 * 1024 * 1024)))
+
+# Params that never change the search result
+IGNORED_PARAMS = {"api_key"}
+
+
+def cache_key(params):
+    """Stable key for a SerpAPI params dict (api_key and empty values dropped)."""
+    normalized = {
+        k: " ".join(str(v).split()).lower()
+        for k, v in params.items()
+        if k not in IGNORED_PARAMS and v is not None and v != ""
+    }
+    payload = json.dumps(normalized, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class SerpCache:
+    """Two-tier (memory LRU + SQLite) cache for SerpAPI responses."""
+
+    def __init__(self, path=CACHE_PATH, memory_entries=MEMORY_MAX_ENTRIES, disk_bytes=DISK_MAX_BYTES):
+        self._memory = OrderedDict()
+        self._memory_entries = memory_entries
+        self._disk_bytes = disk_bytes
+        self._lock = threading.Lock()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "bypassed": 0, "evictions": 0}
+
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, engine TEXT, expires_at REAL, accessed_at REAL, size INTEGER, data TEXT)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses(accessed_at)")
+        self._db.commit()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._memory.move_to_end(key)
+                    self.stats["memory_hits"] += 1
+                    return entry[1]
+                del self._memory[key]
+
+            row = self._db.execute(
+                "SELECT expires_at, data FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or row[0] <= now:
+                self.stats["misses"] += 1
+                return None
+
+            self._db.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self._db.commit()
+            data = json.loads(row[1])
+            self._remember(key, row[0], data)
+            self.stats["disk_hits"] += 1
+            return data
+
+    def set(self, key, data, ttl, engine=""):
+        now = time.time()
+        expires_at = now + ttl
+        blob = json.dumps(data, separators=(",", ":"))
+        with self._lock:
+            self._remember(key, expires_at, data)
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                (key, engine, expires_at, now, len(blob), blob),
+            )
+            self._evict_disk(now)
+            self._db.commit()
+
+    def count(self, stat):
+        with self._lock:
+            self.stats[stat] += 1
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._db.execute("DELETE FROM responses")
+            self._db.commit()
+
+    def _remember(self, key, expires_at, data):
+        self._memory[key] = (expires_at, data)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self._memory_entries:
+            self._memory.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def _evict_disk(self, now):
+        self._db.execute("DELETE FROM responses WHERE expires_at <= ?", (now,))
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self._disk_bytes:
+            return
+        # Drop least recently used rows until we are back under budget
+        for key, size in self._db.execute(
+            "SELECT key, size FROM responses ORDER BY accessed_at"
+        ).fetchall():
+            if total <= self._disk_bytes:
+                break
+            self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+            self.stats["evictions"] += 1
+
+
+_cache = None
+_cache_lock = threading.Lock()
+# Coalesces identical upstream searches, keyed like the cache
+_in_flight = SingleFlight()
+
+
+def get_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = SerpCache()
+        return _cache
+
+
+def _lookup(params, refresh):
+    cache = get_cache()
+    key = cache_key(params)
+    engine = params.get("engine", "")
+    refresh = refresh or os.getenv("SERPAPI_CACHE_BYPASS") == "1"
+    if refresh:
+        cache.count("bypassed")
+        METRICS.inc("cache_lookups_total", engine=engine, result="bypass")
+        return cache, key, None
+    with span("serp_cache.lookup", engine=engine) as attrs:
+        data = cache.get(key)
+        attrs["hit"] = data is not None
+    METRICS.inc("cache_lookups_total", engine=engine, result="hit" if data is not None else "miss")
+    return cache, key, data
+
+
+def _store(cache, key, params, data, ttl):
+    # Never cache SerpAPI error payloads (e.g. "no results")
+    if "error" not in data:
+        cache.set(key, data, ttl, engine=params.get("engine", ""))
+    return data
+
+
+def search(params, ttl, refresh=False):
+    """
+    Cached SerpAPI search returning the decoded JSON response.
+
+    Set refresh=True (or SERPAPI_CACHE_BYPASS=1) to skip the lookup and
+    overwrite the stored entry with a fresh response. Identical searches
+    already in flight (from other threads or tasks) are joined rather than
+    sent again.
+    """
+    cache, key, data = _lookup(params, refresh)
+    if data is not None:
+        return data
+
+    def fetch():
+        with span("serpapi.request", engine=params.get("engine", "")):
+            data = serp_client.search(params)
+        return _store(cache, key, params, data, ttl)
+
+    return _in_flight.do(key, fetch)
+
+
+async def asearch(params, ttl, refresh=False):
+    """Async variant of search()."""
+    cache, key, data = _lookup(params, refresh)
+    if data is not None:
+        return data
+
+    async def fetch():
+        with span("serpapi.request", engine=params.get("engine", "")):
+            data = await serp_client.asearch(params)
+        return _store(cache, key, params, data, ttl)
+
+    return await _in_flight.ado(key, fetch)
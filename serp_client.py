@@ -0,0 +1,254 @@
+"""
+Shared HTTP transport for SerpAPI.
+
+One keep-alive connection pool per process (httpx; the async pool is one
+per event loop, since an AsyncClient is bound to the loop that first used it),
+configurable timeouts, retries with jittered exponential backoff on 429/5xx
+and connection errors, and a token-bucket limiter sized to the SerpAPI plan.
+All attempts of one search, backoff included, fit in SERPAPI_RETRY_BUDGET so
+a search gives up before the agent's tool timeout does.
+"""
+import asyncio
+import os
+import random
+import threading
+import time
+import weakref
+
+import httpx
+
+# Constants
+SERPAPI_URL = "https://serpapi.com/search.json"
+CONNECT_TIMEOUT = float(os.getenv("SERPAPI_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.getenv("SERPAPI_READ_TIMEOUT", "12"))
+# Total time for one search including retries and backoff; keep it below the agent's TOOL_TIMEOUT
+RETRY_BUDGET = float(os.getenv("SERPAPI_RETRY_BUDGET", "25"))
+MAX_CONNECTIONS = int(os.getenv("SERPAPI_MAX_CONNECTIONS", "20"))
+MAX_RETRIES = int(os.getenv("SERPAPI_MAX_RETRIES", "3"))
+BACKOFF_BASE = float(os.getenv("SERPAPI_BACKOFF_BASE", "0.5"))
+BACKOFF_MAX = float(os.getenv("SERPAPI_BACKOFF_MAX", "8"))
+# Requests per second and burst allowed by our SerpAPI plan
+RATE_LIMIT = float(os.getenv("SERPAPI_RATE_LIMIT", "5"))
+RATE_BURST = int(os.getenv("SERPAPI_RATE_BURST", "5"))
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+LATENCY_BUCKETS = (0.25, 0.5, 1, 2, 3, 5, 8, 13, 30)
+
+
+class SerpApiError(Exception):
+    pass
+
+
+class TokenBucket:
+    """Reservation-based token bucket shared by threads and asyncio tasks."""
+
+    def __init__(self, rate=RATE_LIMIT, capacity=RATE_BURST):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self):
+        """Take a token now and return how long the caller must wait before using it."""
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def acquire(self):
+        wait = self._reserve()
+        if wait:
+            time.sleep(wait)
+
+    async def aacquire(self):
+        wait = self._reserve()
+        if wait:
+            await asyncio.sleep(wait)
+
+
+class ClientMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.retries = 0
+        self.errors = 0
+        self.new_connections = 0
+        self.latency_sum = 0.0
+        self.latency_buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def add(self, **counts):
+        with self._lock:
+            for name, value in counts.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def observe(self, seconds):
+        with self._lock:
+            self.requests += 1
+            self.latency_sum += seconds
+            index = next((i for i, b in enumerate(LATENCY_BUCKETS) if seconds <= b), len(LATENCY_BUCKETS))
+            self.latency_buckets[index] += 1
+
+    def snapshot(self):
+        with self._lock:
+            requests = self.requests
+            return {
+                "requests": requests,
+                "retries": self.retries,
+                "errors": self.errors,
+                "new_connections": self.new_connections,
+                "connection_reuse": round(1 - self.new_connections / requests, 3) if requests else None,
+                "latency_avg_s": round(self.latency_sum / requests, 3) if requests else None,
+                "latency_buckets": dict(zip([*map(str, LATENCY_BUCKETS), "+Inf"], self.latency_buckets)),
+            }
+
+
+class SerpClient:
+    def __init__(self, url=SERPAPI_URL, max_retries=MAX_RETRIES, limiter=None, retry_budget=RETRY_BUDGET):
+        self.url = url
+        self.max_retries = max_retries
+        self.retry_budget = retry_budget
+        self.limiter = limiter or TokenBucket()
+        self.metrics = ClientMetrics()
+        self._timeout = httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT)
+        self._limits = httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_CONNECTIONS)
+        self._client = httpx.Client(timeout=self._timeout, limits=self._limits)
+        # event loop -> AsyncClient
+        self._async_clients = weakref.WeakKeyDictionary()
+        self._async_lock = threading.Lock()
+
+    # httpcore trace hooks: count TCP connects to measure keep-alive reuse
+    def _trace(self, event, info):
+        if event == "connection.connect_tcp.complete":
+            self.metrics.add(new_connections=1)
+
+    async def _atrace(self, event, info):
+        self._trace(event, info)
+
+    def search(self, params):
+        """Run a SerpAPI search and return the decoded JSON response."""
+        params = _clean(params)
+        deadline = time.monotonic() + self.retry_budget
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire()
+            start = time.perf_counter()
+            try:
+                response = self._client.get(self.url, params=params, timeout=self._attempt_timeout(deadline),
+                                            extensions={"trace": self._trace})
+            except httpx.TransportError as e:
+                response, error = None, e
+            else:
+                error = None
+            self.metrics.observe(time.perf_counter() - start)
+
+            delay = self._retry_delay(attempt, response, error, deadline)
+            if delay is None:
+                return self._result(response, error)
+            self.metrics.add(retries=1)
+            time.sleep(delay)
+
+    async def asearch(self, params):
+        """Async variant of search() on the running loop's AsyncClient pool."""
+        client = self._loop_client()
+        params = _clean(params)
+        deadline = time.monotonic() + self.retry_budget
+        for attempt in range(self.max_retries + 1):
+            await self.limiter.aacquire()
+            start = time.perf_counter()
+            try:
+                response = await client.get(self.url, params=params, timeout=self._attempt_timeout(deadline),
+                                            extensions={"trace": self._atrace})
+            except httpx.TransportError as e:
+                response, error = None, e
+            else:
+                error = None
+            self.metrics.observe(time.perf_counter() - start)
+
+            delay = self._retry_delay(attempt, response, error, deadline)
+            if delay is None:
+                return self._result(response, error)
+            self.metrics.add(retries=1)
+            await asyncio.sleep(delay)
+
+    def _loop_client(self):
+        loop = asyncio.get_running_loop()
+        with self._async_lock:
+            client = self._async_clients.get(loop)
+            if client is None:
+                client = self._async_clients[loop] = httpx.AsyncClient(timeout=self._timeout, limits=self._limits)
+            return client
+
+    def _attempt_timeout(self, deadline):
+        # The read timeout of one attempt never runs past the search's retry budget
+        remaining = max(deadline - time.monotonic(), 0.1)
+        return httpx.Timeout(min(READ_TIMEOUT, remaining), connect=min(CONNECT_TIMEOUT, remaining))
+
+    def _retry_delay(self, attempt, response, error, deadline):
+        """Seconds to wait before retrying, or None if this attempt is final."""
+        retryable = error is not None or response.status_code in RETRY_STATUS
+        if not retryable or attempt >= self.max_retries:
+            return None
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after and retry_after.isdigit():
+            delay = min(float(retry_after), BACKOFF_MAX)
+        else:
+            # Full jitter
+            delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+        # Not enough budget left for the wait plus a useful attempt
+        if time.monotonic() + delay + CONNECT_TIMEOUT >= deadline:
+            return None
+        return delay
+
+    def _result(self, response, error):
+        if error is not None:
+            self.metrics.add(errors=1)
+            raise SerpApiError(f"SerpAPI request failed: {error}") from error
+        try:
+            data = response.json()
+        except ValueError:
+            data = {}
+        if response.status_code != 200:
+            self.metrics.add(errors=1)
+            raise SerpApiError(f"SerpAPI returned {response.status_code}: {data.get('error', response.text[:200])}")
+        return data
+
+    def close(self):
+        self._client.close()
+        with self._async_lock:
+            clients = list(self._async_clients.items())
+            self._async_clients.clear()
+        for loop, client in clients:
+            if loop.is_closed():
+                continue  # its connections went with the loop
+            if loop.is_running():
+                asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+            else:
+                loop.run_until_complete(client.aclose())
+
+
+def _clean(params):
+    return {k: v for k, v in params.items() if v is not None}
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = SerpClient()
+        return _client
+
+
+def search(params):
+    return get_client().search(params)
+
+
+async def asearch(params):
+    return await get_client().asearch(params)
@@ -0,0 +1,279 @@
+"""
+Headless HTTP API for itinerary planning.
+
+    python server.py --port 8080 --workers 4 --queue-size 100 --per-key 2
+
+    POST /trips                 trip request JSON (same fields as batch.py, optionally
+                                "legs": [{"destination", "start_date", "end_date"}, ...]) -> 202 {"id": ...}
+    GET  /trips/{id}            job status, and the itinerary once done
+    GET  /trips/{id}/stream     server-sent events: status, tools, general, day, result/error
+    GET  /healthz, /metrics     liveness and Prometheus metrics
+
+Jobs wait in a bounded queue and are planned by a fixed number of workers,
+which caps concurrent Gemini/SerpAPI load. A full queue, or a client key
+(X-Client-Key header, else the remote address) with too many jobs queued or
+running, gets 429 with Retry-After. Jobs live in process memory, so run one
+process per port and route a job's polls to the process that accepted it.
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+import uuid
+
+from aiohttp import web
+from dotenv import load_dotenv
+from langchain_core.messages import HumanMessage
+
+from agent import Agent, itinerary_text, stream_events
+from instrumentation import METRICS, span
+from itinerary_cache import remember_itinerary, reuse_itinerary
+from itinerary_parser import ItineraryParseError, parse_itinerary, validate_itinerary
+from trip_context import TripContext
+
+# Constants
+SERVER_WORKERS = int(os.getenv("SERVER_WORKERS", "4"))
+SERVER_QUEUE_SIZE = int(os.getenv("SERVER_QUEUE_SIZE", "100"))
+SERVER_PER_KEY_LIMIT = int(os.getenv("SERVER_PER_KEY_LIMIT", "2"))
+# Finished jobs are kept this long for polling
+JOB_TTL = int(os.getenv("SERVER_JOB_TTL", "3600"))
+RETRY_AFTER = 5
+
+
+class Job:
+    def __init__(self, key, ctx):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.ctx = ctx
+        self.status = "queued"
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.finished = None
+        self.events = []
+        self._loop = asyncio.get_running_loop()
+        self._changed = asyncio.Event()
+
+    def emit(self, event, data):
+        """Record an event; safe to call from the planning thread."""
+        self.events.append((event, data))
+        self._loop.call_soon_threadsafe(self._changed.set)
+
+    async def wait_for_events(self, seen):
+        while len(self.events) <= seen:
+            self._changed.clear()
+            if len(self.events) > seen:
+                break
+            await self._changed.wait()
+
+    @property
+    def closed(self):
+        return bool(self.events) and self.events[-1][0] in ("result", "error")
+
+    def to_dict(self):
+        data = {"id": self.id, "status": self.status, "trip": self.ctx.to_dict()}
+        if self.result is not None:
+            data["itinerary"] = self.result
+        if self.error is not None:
+            data["error"] = self.error
+        if self.finished:
+            data["elapsed_s"] = round(self.finished - self.created, 2)
+        return data
+
+
+class PlanningService:
+    def __init__(self, agent, workers=SERVER_WORKERS, queue_size=SERVER_QUEUE_SIZE, per_key_limit=SERVER_PER_KEY_LIMIT):
+        self.agent = agent
+        self.workers = workers
+        self.per_key_limit = per_key_limit
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.jobs = {}
+        self.active_by_key = {}
+        self._tasks = []
+
+    async def start(self, app):
+        self._tasks = [asyncio.create_task(self._worker(n)) for n in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._expire_jobs()))
+
+    async def stop(self, app):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def submit(self, key, ctx):
+        """Queue a job, or return None if the service or this key is saturated."""
+        if self.active_by_key.get(key, 0) >= self.per_key_limit:
+            METRICS.inc("server_rejected_total", reason="per_key")
+            return None
+        job = Job(key, ctx)
+        try:
+            self.queue.put_nowait(job)
+        except asyncio.QueueFull:
+            METRICS.inc("server_rejected_total", reason="queue_full")
+            return None
+        self.jobs[job.id] = job
+        self.active_by_key[key] = self.active_by_key.get(key, 0) + 1
+        METRICS.inc("server_jobs_total", status="queued")
+        return job
+
+    async def _worker(self, n):
+        while True:
+            job = await self.queue.get()
+            try:
+                await self._run(job)
+            finally:
+                self.active_by_key[job.key] -= 1
+                if not self.active_by_key[job.key]:
+                    del self.active_by_key[job.key]
+                job.finished = time.time()
+                METRICS.inc("server_jobs_total", status=job.status)
+                self.queue.task_done()
+
+    async def _run(self, job):
+        job.status = "running"
+        job.emit("status", {"status": "running"})
+        try:
+            itinerary = await asyncio.to_thread(self._plan, job)
+            job.result, job.status = itinerary, "done"
+            job.emit("result", itinerary)
+        except Exception as e:
+            job.error, job.status = str(e), "error"
+            job.emit("error", {"error": job.error})
+
+    def _plan(self, job):
+        # Runs on a worker thread: the graph, its tools and the checkpointer are synchronous
+        with span("server.job"):
+            itinerary = reuse_itinerary(job.ctx)
+            if itinerary is None:
+                itinerary = self._run_graph(job)
+        return itinerary
+
+    def _run_graph(self, job):
+        config = {"configurable": {"thread_id": f"api-{job.id}", "trip_context": job.ctx}}
+        messages = [HumanMessage(content=job.ctx.user_message())]
+        for event in stream_events(self.agent.graph, messages, config):
+            if event[0] == "tools":
+                job.emit("tools", {"tool": event[1], "results": event[2]})
+            elif event[0] == "general":
+                job.emit("general", {"general": event[1]})
+            else:
+                job.emit("day", {"day": event[1], "activities": event[2]})
+
+        text = itinerary_text(self.agent.graph.get_state(config).values["messages"])
+        if text is None:
+            raise ItineraryParseError("The agent did not produce an itinerary")
+        itinerary = parse_itinerary(text)
+        if not validate_itinerary(itinerary):
+            remember_itinerary(job.ctx, itinerary)
+        return itinerary
+
+    async def _expire_jobs(self):
+        while True:
+            await asyncio.sleep(60)
+            cutoff = time.time() - JOB_TTL
+            for job_id in [j.id for j in self.jobs.values() if j.finished and j.finished < cutoff]:
+                del self.jobs[job_id]
+
+
+def _client_key(request):
+    return request.headers.get("X-Client-Key") or request.remote or "anonymous"
+
+
+def _too_many(message):
+    return web.json_response({"error": message}, status=429, headers={"Retry-After": str(RETRY_AFTER)})
+
+
+async def submit_trip(request):
+    service = request.app["service"]
+    try:
+        body = await request.json()
+        ctx = TripContext.from_dict(body)
+    except (ValueError, TypeError, AttributeError) as e:
+        return web.json_response({"error": f"Invalid trip request: {e}"}, status=400)
+    if not ctx.destination:
+        return web.json_response({"error": "destination is required"}, status=400)
+
+    job = service.submit(_client_key(request), ctx)
+    if job is None:
+        return _too_many("Planning capacity is saturated; retry later")
+    return web.json_response(
+        {"id": job.id, "status": job.status, "poll": f"/trips/{job.id}", "stream": f"/trips/{job.id}/stream"},
+        status=202,
+    )
+
+
+def _job(request):
+    job = request.app["service"].jobs.get(request.match_info["job_id"])
+    if job is None:
+        raise web.HTTPNotFound(text=json.dumps({"error": "Unknown job"}), content_type="application/json")
+    return job
+
+
+async def get_trip(request):
+    return web.json_response(_job(request).to_dict())
+
+
+async def stream_trip(request):
+    job = _job(request)
+    response = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"})
+    await response.prepare(request)
+    await response.write(f"event: status\ndata: {json.dumps({'status': job.status})}\n\n".encode("utf-8"))
+
+    seen = 0
+    while True:
+        events = job.events[seen:]
+        for event, data in events:
+            await response.write(f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8"))
+        seen += len(events)
+        if job.closed and seen == len(job.events):
+            break
+        await job.wait_for_events(seen)
+    await response.write_eof()
+    return response
+
+
+async def healthz(request):
+    service = request.app["service"]
+    return web.json_response({"status": "ok", "queued": service.queue.qsize(), "workers": service.workers})
+
+
+async def metrics(request):
+    service = request.app["service"]
+    return web.Response(
+        text=METRICS.prometheus() + f"# TYPE tripgenie_server_queue_depth gauge\ntripgenie_server_queue_depth {service.queue.qsize()}\n",
+        content_type="text/plain",
+    )
+
+
+def create_app(agent=None, **service_options):
+    app = web.Application()
+    service = PlanningService(agent or Agent(max_concurrency=service_options.get("workers", SERVER_WORKERS) * 2),
+                              **service_options)
+    app["service"] = service
+    app.on_startup.append(service.start)
+    app.on_cleanup.append(service.stop)
+    app.router.add_post("/trips", submit_trip)
+    app.router.add_get("/trips/{job_id}", get_trip)
+    app.router.add_get("/trips/{job_id}/stream", stream_trip)
+    app.router.add_get("/healthz", healthz)
+    app.router.add_get("/metrics", metrics)
+    return app
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve itinerary planning over HTTP.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=SERVER_WORKERS, help="Trips planned concurrently")
+    parser.add_argument("--queue-size", type=int, default=SERVER_QUEUE_SIZE, help="Queued trips before 429")
+    parser.add_argument("--per-key", type=int, default=SERVER_PER_KEY_LIMIT, help="Queued + running trips per client")
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    app = create_app(workers=args.workers, queue_size=args.queue_size, per_key_limit=args.per_key)
+    web.run_app(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
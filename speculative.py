@@ -0,0 +1,165 @@
+"""
+Speculative hotel/flight searches while the trip form is being filled in.
+
+Once destination and dates are valid, the searches the agent's prefetch
+node will run are started in the background after a short debounce. A
+field change cancels the pending debounce and any search that has not
+started yet. Results land in the SerpAPI cache (and joins the singleflight
+if still running), so the agent picks them up without any hand-off.
+
+Every search the user moves away from before submitting is wasted quota;
+each form session may waste at most SPECULATIVE_MAX_WASTED searches before
+speculation stops for it.
+"""
+import datetime
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from flight_tool import FlightsInput, flights_finder
+from hotel_tool import HotelsInput, hotels_finder
+from instrumentation import METRICS, span
+from multi_city import leg_tool_calls
+from trip_context import fill_tool_args
+
+# Constants
+SPECULATIVE_PREFETCH = os.getenv("SPECULATIVE_PREFETCH", "1") == "1"
+SPECULATIVE_DEBOUNCE = float(os.getenv("SPECULATIVE_DEBOUNCE", "1.0"))
+SPECULATIVE_MAX_WASTED = int(os.getenv("SPECULATIVE_MAX_WASTED", "4"))
+SPECULATIVE_WORKERS = int(os.getenv("SPECULATIVE_WORKERS", "2"))
+MAX_SESSIONS = 1000
+
+
+def trip_searches(ctx):
+    """The hotel and flight searches a trip will need, keyed for de-duplication."""
+    if ctx.legs:
+        return _leg_searches(ctx)
+    hotel = HotelsInput(**fill_tool_args("hotels_finder", {}, ctx))
+    searches = [(("hotels", hotel.json(sort_keys=True)), hotels_finder, hotel)]
+    if ctx.origin:
+        flight = FlightsInput(**fill_tool_args("flights_finder", {}, ctx))
+        searches.append((("flights", flight.json(sort_keys=True)), flights_finder, flight))
+    return searches
+
+
+def _leg_searches(ctx):
+    searches = []
+    for index in range(len(ctx.legs)):
+        for call in leg_tool_calls(ctx, index, "speculative"):
+            if call["name"] == "hotels_finder":
+                params = HotelsInput(**call["args"]["params"])
+                searches.append((("hotels", params.json(sort_keys=True)), hotels_finder, params))
+            else:
+                params = FlightsInput(**call["args"]["params"])
+                searches.append((("flights", params.json(sort_keys=True)), flights_finder, params))
+    return searches
+
+
+def ready_searches(ctx):
+    """trip_searches() for a form that is complete enough to search, else []."""
+    try:
+        start = datetime.date.fromisoformat(ctx.start_date)
+        end = datetime.date.fromisoformat(ctx.end_date)
+    except (TypeError, ValueError):
+        return []
+    if len(ctx.destination.strip()) < 2 or start < datetime.date.today() or end <= start:
+        return []
+    # Skip the flight search until both ends resolve to an IATA code
+    return [(key, tool, params) for key, tool, params in trip_searches(ctx)
+            if key[0] == "hotels" or (_is_iata(params.departure_airport) and _is_iata(params.arrival_airport))]
+
+
+def _is_iata(code):
+    return isinstance(code, str) and len(code) == 3 and code.isalpha() and code.isupper()
+
+
+class _Session:
+    def __init__(self):
+        self.keys = ()
+        self.timer = None
+        self.futures = {}
+        self.issued = set()
+
+
+class SpeculativePrefetcher:
+    def __init__(self, debounce=SPECULATIVE_DEBOUNCE, max_wasted=SPECULATIVE_MAX_WASTED, workers=SPECULATIVE_WORKERS):
+        self.debounce = debounce
+        self.max_wasted = max_wasted
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="speculative")
+        self._lock = threading.Lock()
+        self._sessions = OrderedDict()
+        self.stats = {"started": 0, "cancelled": 0, "capped": 0, "used": 0, "wasted": 0}
+
+    def _count(self, stat, n=1):
+        self.stats[stat] += n
+        METRICS.inc("speculative_searches_total", n, result=stat)
+
+    def update(self, session, ctx):
+        """Call on every form change; (re)schedules the searches for the current values."""
+        searches = ready_searches(ctx)
+        keys = tuple(key for key, _, _ in searches)
+        with self._lock:
+            state = self._sessions.get(session)
+            if state is None:
+                state = self._sessions[session] = _Session()
+                while len(self._sessions) > MAX_SESSIONS:
+                    self._cancel(self._sessions.popitem(last=False)[1])
+            self._sessions.move_to_end(session)
+            if keys == state.keys:
+                return
+            self._cancel(state)
+            state.keys = keys
+            if searches:
+                state.timer = threading.Timer(self.debounce, self._start, (session, state, searches))
+                state.timer.daemon = True
+                state.timer.start()
+
+    def commit(self, session, ctx):
+        """The form was submitted with ctx: settle which speculative searches were useful."""
+        keys = tuple(key for key, _, _ in ready_searches(ctx))
+        with self._lock:
+            state = self._sessions.get(session)
+            if state is None:
+                return
+            self._cancel(state)
+            self._count("used", len(state.issued & set(keys)))
+            self._count("wasted", len(state.issued - set(keys)))
+            # Reruns with the submitted form (e.g. on the results page) must not search it again
+            state.keys = keys
+            state.issued = set()
+
+    def _start(self, session, state, searches):
+        with self._lock:
+            if self._sessions.get(session) is not state or state.keys != tuple(k for k, _, _ in searches):
+                return  # superseded while the debounce timer fired
+            state.timer = None
+            for key, tool, params in searches:
+                if key in state.issued:
+                    continue
+                # Issued searches the form has since moved away from
+                if len(state.issued - set(state.keys)) >= self.max_wasted:
+                    self._count("capped")
+                    continue
+                state.issued.add(key)
+                state.futures[key] = self._executor.submit(self._search, key[0], tool, params)
+                self._count("started")
+
+    def _cancel(self, state):
+        if state.timer is not None:
+            state.timer.cancel()
+            state.timer = None
+        for key, future in list(state.futures.items()):
+            if future.cancel():
+                # Never ran, so it costs nothing
+                state.issued.discard(key)
+                self._count("cancelled")
+            del state.futures[key]
+
+    @staticmethod
+    def _search(kind, tool, params):
+        try:
+            with span(f"speculative.{kind}"):
+                tool.invoke({"params": params})
+        except Exception as e:
+            print(f"⚠️ Speculative {kind} search failed: {e}")
@@ -0,0 +1,69 @@
+"""
+Edge cases of itinerary parsing: fences, prose around the JSON and output
+cut off mid-stream.
+
+    python -m pytest tests
+"""
+import json
+import os
+
+import pytest
+
+from itinerary_parser import ItineraryParseError, ItineraryStreamParser, parse_itinerary, repair_json
+
+FIXTURE = os.path.join(os.path.dirname(__file__), "..", "benchmarks", "fixtures", "gemini_paris.json")
+
+
+@pytest.fixture(scope="module")
+def itinerary():
+    with open(FIXTURE, encoding="utf-8") as f:
+        return parse_itinerary(json.load(f)["responses"][-1]["content"])
+
+
+def test_fenced_with_prose(itinerary):
+    text = f"Here is your trip {{enjoy}}:\n```json\n{json.dumps(itinerary)}\n```\nHave fun!"
+    assert parse_itinerary(text) == itinerary
+
+
+def test_stream_matches_whole_text(itinerary):
+    text = json.dumps(itinerary)
+    parser = ItineraryStreamParser()
+    days = []
+    for i in range(0, len(text), 7):
+        days += [event[1] for event in parser.feed(text[i:i + 7]) if event[0] == "plan"]
+    assert parser.result == itinerary
+    assert days == list(itinerary["plan"][0])
+
+
+@pytest.mark.parametrize("tail", [
+    '"gen',                      # inside a key
+    '"general"',                 # key without a colon
+    '"general":',                # dangling key
+    '"general": ',
+    '"general": "Two days in Pa',
+    '"rating": 4',               # number that may be incomplete
+    '"general": "Caf\\u00',      # inside a \u escape
+    '"general": "line\\',
+])
+def test_repair_cut_off_key_or_value(tail):
+    data = json.loads(repair_json('{"plan": [], ' + tail))
+    assert data["plan"] == []
+    assert set(data) <= {"plan", "general"}
+
+
+def test_truncated_itinerary_is_never_a_nested_object(itinerary):
+    text = json.dumps(itinerary)
+    for cut in range(1, len(text) - len('{"general": "')):
+        result = parse_itinerary(text[:-cut])
+        assert "general" in result, f"cut {cut}: parsed {sorted(result)}"
+
+
+@pytest.mark.parametrize("text", ['{"general":', '{"name": "Hotel", "rating": 4.5}', "no json here"])
+def test_rejects_non_itinerary(text):
+    with pytest.raises(ItineraryParseError):
+        parse_itinerary(text)
+
+
+def test_skips_unrelated_object_before_itinerary(itinerary):
+    text = '{"note": "draft"} ' + json.dumps(itinerary)
+    assert parse_itinerary(text) == itinerary
@@ -0,0 +1,25 @@
+"""
+Offline token estimates for prompt budgeting and reports.
+
+Gemini's tokenizer is not available offline; ~4 characters per token is
+close enough for English text and JSON to compare prompt sizes.
+"""
+import json
+
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text):
+    if not isinstance(text, str):
+        text = json.dumps(text, ensure_ascii=False, default=str)
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def message_tokens(messages):
+    """Estimated tokens for a list of LangChain messages (content + tool call args)."""
+    total = 0
+    for m in messages:
+        total += estimate_tokens(m.content if isinstance(m.content, str) else json.dumps(m.content, default=str))
+        for call in getattr(m, "tool_calls", None) or []:
+            total += estimate_tokens(call.get("args", {}))
+    return total
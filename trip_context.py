@@ -0,0 +1,156 @@
+"""
+Per-request trip context.
+
+A TripContext travels with each graph run in
+config["configurable"]["trip_context"], so the agent never reads UI state and
+concurrent runs in one process stay independent. fill_tool_args() derives
+missing hotel/flight search arguments from it; it is pure and thread-safe.
+
+A multi-city trip lists its stays in legs; destination and the trip dates
+are then derived from them (see multi_city.py).
+"""
+import datetime
+from dataclasses import asdict, dataclass, fields
+
+from airports import resolve_airport
+
+HOTEL_CLASS_BY_BUDGET = {"low": "1,2", "medium": "3,4", "high": "5"}
+
+
+@dataclass(frozen=True)
+class Leg:
+    """One stay of a multi-city trip: a city and the check-in/check-out dates."""
+    destination: str
+    start_date: str
+    end_date: str
+
+    @classmethod
+    def from_dict(cls, data):
+        if isinstance(data, Leg):
+            return data
+        leg = cls(**{k: str(data.get(k) or "").strip() for k in ("destination", "start_date", "end_date")})
+        if not leg.destination:
+            raise ValueError("every leg needs a destination")
+        try:
+            start = datetime.date.fromisoformat(leg.start_date)
+            end = datetime.date.fromisoformat(leg.end_date)
+        except ValueError:
+            raise ValueError(f"leg {leg.destination}: dates must be YYYY-MM-DD")
+        if end <= start:
+            raise ValueError(f"leg {leg.destination}: end_date must be after start_date")
+        return leg
+
+
+def _legs(values):
+    legs = tuple(Leg.from_dict(leg) for leg in values or ())
+    for previous, leg in zip(legs, legs[1:]):
+        if leg.start_date < previous.end_date:
+            raise ValueError(f"legs overlap: {leg.destination} starts before {previous.destination} ends")
+    return legs
+
+
+@dataclass(frozen=True)
+class TripContext:
+    origin: str = ""
+    destination: str = ""
+    start_date: str = ""
+    end_date: str = ""
+    budget: str = "Medium"
+    interests: str = ""
+    avoid: str = ""
+    adults: int = 1
+    children: int = 0
+    # Accept outbound/return dates up to this many days earlier or later
+    flex_days: int = 0
+    # Multi-city trips: the stays in order, each reached by a one-way flight
+    legs: tuple = ()
+
+    @classmethod
+    def from_dict(cls, data):
+        known = {f.name for f in fields(cls)}
+        values = {k: v for k, v in data.items() if k in known}
+        for key in ("start_date", "end_date"):
+            if key in values and values[key] is not None:
+                values[key] = str(values[key])
+        values["legs"] = _legs(values.get("legs"))
+        if values["legs"]:
+            legs = values["legs"]
+            values["destination"] = " → ".join(leg.destination for leg in legs)
+            values["start_date"], values["end_date"] = legs[0].start_date, legs[-1].end_date
+        return cls(**values)
+
+    def to_dict(self):
+        return asdict(self)
+
+    def user_message(self):
+        """The trip request as sent to the agent."""
+        if self.legs:
+            stays = "".join(f"- {leg.destination}: {leg.start_date} to {leg.end_date}\n" for leg in self.legs)
+            return f"""
+Create a personalized multi-city itinerary.
+origin: {self.origin}
+Stays (in order):
+{stays}Budget: {self.budget}
+Interests: {self.interests}
+Avoid: {self.avoid}
+children: {self.children}
+adult: {self.adults}
+"""
+        return f"""
+Create a personalized itinerary.
+origin: {self.origin}
+Destination: {self.destination}
+Start Date: {self.start_date}
+End Date: {self.end_date}
+Budget: {self.budget}
+Interests: {self.interests}
+Avoid: {self.avoid}
+children: {self.children}
+adult: {self.adults}
+"""
+
+
+def get_trip_context(config):
+    """The TripContext of a graph run (empty if the caller did not provide one)."""
+    ctx = ((config or {}).get("configurable") or {}).get("trip_context")
+    if isinstance(ctx, dict):
+        return TripContext.from_dict(ctx)
+    return ctx or TripContext()
+
+
+def _airport(value):
+    # LLMs sometimes pass a city name where an IATA code is expected
+    if isinstance(value, str) and len(value) == 3 and value.isalpha() and value.isupper():
+        return value
+    return resolve_airport(value) or value or None
+
+
+def fill_tool_args(name, args, ctx):
+    """
+    Return a copy of a tool call's arguments with missing fields filled from
+    the trip context. Accepts both {"params": {...}} (the tool schema) and flat
+    argument dicts.
+    """
+    args = dict(args.get("params", args) if isinstance(args.get("params"), dict) else args)
+    today = str(datetime.date.today())
+    budget = (ctx.budget or "Medium").lower()
+
+    if name == "hotels_finder":
+        args.setdefault("q", ctx.destination)
+        args.setdefault("check_in_date", ctx.start_date or today)
+        args.setdefault("check_out_date", ctx.end_date or today)
+        args.setdefault("adults", ctx.adults)
+        args.setdefault("children", ctx.children)
+        if budget in HOTEL_CLASS_BY_BUDGET:
+            args.setdefault("hotel_class", HOTEL_CLASS_BY_BUDGET[budget])
+        args.setdefault("sort_by", "3" if budget == "low" else "8")
+
+    elif name == "flights_finder":
+        args["departure_airport"] = _airport(args.get("departure_airport") or ctx.origin)
+        args["arrival_airport"] = _airport(args.get("arrival_airport") or ctx.destination)
+        args.setdefault("outbound_date", ctx.start_date or today)
+        args.setdefault("return_date", ctx.end_date or today)
+        args.setdefault("adults", ctx.adults)
+        args.setdefault("children", ctx.children)
+
+    return args